@@ -1,5 +1,9 @@
 import httpx
 from app.config import settings
+from app.core.shared_cache import cache_backend
+
+AIRPORT_CODE_TTL = 7 * 24 * 3600
+TOKEN_CACHE_KEY = "amadeus:token"
 
 async def get_airport_code(city_name: str) -> str:
     """
@@ -8,6 +12,11 @@ async def get_airport_code(city_name: str) -> str:
     """
     # Clean the city name - take only the first part before any comma
     clean_city = city_name.split(',')[0].strip()
+
+    cache_key = f"airport:{clean_city.lower()}"
+    cached_code = await cache_backend.aget(cache_key)
+    if cached_code:
+        return cached_code
     
     # First get the access token
     token = await get_access_token()
@@ -56,13 +65,18 @@ async def get_airport_code(city_name: str) -> str:
                 return clean_city[:3].upper()  # Last resort fallback
             
             # Try to find the most relevant airport
+            code = None
             for location in locations:
                 # Check if it's an airport
                 if location.get("subType") == "AIRPORT":
-                    return location.get("iataCode", location.get("id"))
+                    code = location.get("iataCode", location.get("id"))
+                    break
             
-            # If no airport found, return the first city's code
-            return locations[0].get("iataCode", locations[0].get("id"))
+            # If no airport found, use the first city's code
+            if not code:
+                code = locations[0].get("iataCode", locations[0].get("id"))
+            await cache_backend.aset(cache_key, code, ttl=AIRPORT_CODE_TTL)
+            return code
             
         error_detail = f"API Error: {response.status_code}"
         try:
@@ -76,6 +90,11 @@ async def get_airport_code(city_name: str) -> str:
         return city_name.strip().upper()[:3]
 
 async def get_access_token() -> str:
+    # Tokens are valid for ~30 minutes, share one across requests (and workers) until it nears expiry
+    cached_token = await cache_backend.aget(TOKEN_CACHE_KEY)
+    if cached_token:
+        return cached_token
+
     params = {
         "grant_type": "client_credentials",
         "client_id": settings.AMADEUS_API_KEY,
@@ -88,6 +107,9 @@ async def get_access_token() -> str:
             data=params
         )
         if response.status_code == 200:
-            return response.json()["access_token"]
+            payload = response.json()
+            ttl = max(payload.get("expires_in", 1799) - 60, 60)
+            await cache_backend.aset(TOKEN_CACHE_KEY, payload["access_token"], ttl=ttl)
+            return payload["access_token"]
         else:
             raise Exception("Failed to get access token from Amadeus API") 
\ No newline at end of file
@@ -1,11 +1,9 @@
 import httpx
-from app.config import settings
 from datetime import datetime, timedelta
 import json
-from app.agents.airport_codes import get_airport_code
+from app.agents.airport_codes import get_airport_code, get_access_token
 
 AMADEUS_API_URL = "https://test.api.amadeus.com/v2"
-TOKEN_URL = "https://test.api.amadeus.com/v1/security/oauth2/token"
 
 def simplify_flight_data(flight_data: dict) -> dict:
     """Simplify the flight data to include only essential information, preserving all connections."""
@@ -190,17 +188,3 @@ async def get_flight_offers(origin: str, destination: str, departure_date: str,
                 "status_code": response.status_code,
                 "details": response.text
             }
-
-async def get_access_token() -> str:
-    params = {
-        "grant_type": "client_credentials",
-        "client_id": settings.AMADEUS_API_KEY,
-        "client_secret": settings.AMADEUS_API_SECRET
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(TOKEN_URL, data=params)
-        if response.status_code == 200:
-            return response.json()["access_token"]
-        else:
-            raise Exception("Failed to get access token from Amadeus API")
\ No newline at end of file
@@ -3,44 +3,20 @@ from app.config import settings
 import asyncio
 
 FSQ_SEARCH_URL = "https://api.foursquare.com/v3/places/search"
-FSQ_PHOTO_URL = "https://api.foursquare.com/v3/places/{fsq_id}/photos"
 HEADERS = {
     "Authorization": settings.FOURSQUARE_API_KEY
 }
 
-async def get_places(city: str, category: str, limit: int = 5, max_retries: int = 3) -> list:
-    params = {
-        "query": category,
-        "near": city,
-        "limit": limit,
-        "sort": "RELEVANCE"
-    }
-
+async def search_places(client: httpx.AsyncClient, params: dict, max_retries: int = 3) -> dict:
+    """Run a Foursquare place search, retrying connection problems and timeouts with exponential backoff"""
     retry_count = 0
     last_exception = None
 
     while retry_count < max_retries:
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:  # Set explicit timeout
-                response = await client.get(FSQ_SEARCH_URL, headers=HEADERS, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                places = []
-                for place in data.get("results", []):
-                    fsq_id = place.get("fsq_id")
-                    photo_url = await get_place_photo(client, fsq_id)
-
-                    places.append({
-                        "name": place["name"],
-                        "address": place["location"].get("formatted_address", "N/A"),
-                        "categories": [c["name"] for c in place.get("categories", [])],
-                        "latitude": place["geocodes"]["main"]["latitude"],
-                        "longitude": place["geocodes"]["main"]["longitude"],
-                        "photo_url": photo_url
-                    })
-
-                return places
+            response = await client.get(FSQ_SEARCH_URL, headers=HEADERS, params=params)
+            response.raise_for_status()
+            return response.json()
                 
         except httpx.ConnectTimeout as e:
             retry_count += 1
@@ -67,18 +43,4 @@ async def get_places(city: str, category: str, limit: int = 5, max_retries: int
         raise last_exception
     
     # Fallback empty response if somehow we got here
-    return []
-
-async def get_place_photo(client: httpx.AsyncClient, fsq_id: str) -> str:
-    try:
-        url = FSQ_PHOTO_URL.format(fsq_id=fsq_id)
-        response = await client.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            photos = response.json()
-            if photos:
-                photo = photos[0]  # Use the first photo
-                return f"{photo['prefix']}original{photo['suffix']}"
-    except Exception:
-        # Silently handle photo fetch errors - photos are optional
-        pass
-    return ""
\ No newline at end of file
+    return {}
@@ -0,0 +1,140 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from app.agents.foursquare_agent import search_places
+from app.config import settings
+from app.core.cities import normalize_city
+from app.core.shared_cache import cache_backend
+from app.core.spatial_index import SpatialIndex
+
+# Foursquare taxonomy IDs: Arts & Entertainment + Landmarks & Outdoors, Restaurant, Hotel
+CATEGORY_IDS = {
+    "attractions": "10000,16000",
+    "restaurants": "13065",
+    "hotels": "19014",
+}
+DEFAULT_CATEGORIES = tuple(CATEGORY_IDS)
+
+# Asking for photos in the search response saves one round-trip per place
+SEARCH_FIELDS = "fsq_id,name,location,categories,geocodes,photos"
+GEOCODE_TTL = 30 * 24 * 3600
+PLACES_TTL = 24 * 3600
+
+spatial_index = SpatialIndex()
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def tile_for(lat: float, lng: float) -> Tuple[int, int]:
+    return round(lat / settings.PLACES_TILE_DEGREES), round(lng / settings.PLACES_TILE_DEGREES)
+
+
+def tile_center(tile: Tuple[int, int]) -> Tuple[float, float]:
+    return tile[0] * settings.PLACES_TILE_DEGREES, tile[1] * settings.PLACES_TILE_DEGREES
+
+
+def _simplify(place: dict, category: str) -> dict:
+    photos = place.get("photos") or []
+    photo_url = f"{photos[0]['prefix']}original{photos[0]['suffix']}" if photos else ""
+    return {
+        "fsq_id": place.get("fsq_id"),
+        "name": place["name"],
+        "address": place.get("location", {}).get("formatted_address", "N/A"),
+        "categories": [c["name"] for c in place.get("categories", [])],
+        "category": category,
+        "latitude": place["geocodes"]["main"]["latitude"],
+        "longitude": place["geocodes"]["main"]["longitude"],
+        "photo_url": photo_url
+    }
+
+
+async def _once(key: str, factory):
+    """
+    Share one in-flight upstream call between concurrent requests for the same key. The call outlives
+    any single caller, so the factory must own its resources (its own HTTP client) rather than borrow them.
+    """
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future)
+
+
+async def resolve_city(city: str) -> Tuple[float, float]:
+    """Geocode a free-text city once, via Foursquare's `near` resolution, and remember it"""
+    cache_key = f"geo:{normalize_city(city)}"
+    cached = await cache_backend.aget(cache_key)
+    if cached:
+        return tuple(cached)
+
+    async def geocode():
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            data = await search_places(client, {"near": city, "limit": 1, "fields": "geocodes"})
+        center = data.get("context", {}).get("geo_bounds", {}).get("circle", {}).get("center")
+        if center:
+            location = (center["latitude"], center["longitude"])
+        elif data.get("results"):
+            main = data["results"][0]["geocodes"]["main"]
+            location = (main["latitude"], main["longitude"])
+        else:
+            raise Exception(f"Could not locate city: {city}")
+        await cache_backend.aset(cache_key, list(location), ttl=GEOCODE_TTL)
+        return location
+
+    return await _once(cache_key, geocode)
+
+
+async def _fetch_category(tile: Tuple[int, int], category: str, limit: int) -> List[dict]:
+    cache_key = f"places:{tile[0]}:{tile[1]}:{category}:{limit}"
+    cached = await cache_backend.aget(cache_key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        lat, lng = tile_center(tile)
+        params = {
+            "ll": f"{lat:.4f},{lng:.4f}",
+            "radius": settings.PLACES_RADIUS_M,
+            "categories": CATEGORY_IDS[category],
+            "fields": SEARCH_FIELDS,
+            "limit": limit,
+            "sort": "RELEVANCE"
+        }
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            data = await search_places(client, params)
+        places = [_simplify(place, category) for place in data.get("results", []) if place.get("geocodes")]
+        await cache_backend.aset(cache_key, places, ttl=PLACES_TTL)
+        return places
+
+    return await _once(cache_key, fetch)
+
+
+async def get_places_for_city(city: str, categories: Iterable[str] = DEFAULT_CATEGORIES, limit: int = 5) -> Dict[str, List[dict]]:
+    """
+    Fetch several categories for a city in one coordinated pass. Results are cached per geo-tile,
+    so differently spelled names of the same place ("Chicago", "Chicago, IL") share entries.
+    """
+    categories = list(categories)
+    unknown = [category for category in categories if category not in CATEGORY_IDS]
+    if unknown:
+        raise ValueError(f"Unknown place categories: {', '.join(unknown)}")
+
+    lat, lng = await resolve_city(city)
+    tile = tile_for(lat, lng)
+    results = await asyncio.gather(*(_fetch_category(tile, category, limit) for category in categories))
+
+    by_category = dict(zip(categories, results))
+    for places in results:
+        spatial_index.add_many(places)
+    return by_category
+
+
+def search_nearby(lat: float, lng: float, radius_km: float, category: Optional[str] = None) -> List[dict]:
+    return spatial_index.within_radius(lat, lng, radius_km, category)
+
+
+def search_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                category: Optional[str] = None) -> List[dict]:
+    return spatial_index.within_bbox(min_lat, min_lng, max_lat, max_lng, category)
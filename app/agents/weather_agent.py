@@ -1,32 +1,149 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import asyncio
+import time
 import httpx
+from typing import Dict, List, Optional, Tuple
 from app.config import settings
+from app.core.cities import normalize_city
+from app.core.climatology import climatology_store
+from app.core.shared_cache import cache_backend
 
 FORECAST_API_URL = "http://api.weatherapi.com/v1/forecast.json"
 HISTORICAL_API_URL = "http://api.weatherapi.com/v1/history.json"
+DAY_FIELDS = ("avg_temp_c", "condition", "max_wind_kph", "humidity")
+BACKFILL_BATCH_DAYS = 31
+# WeatherAPI forecasts today plus the next 13 days
+FORECAST_HORIZON_DAYS = 14
+
+# Shared by every backfill job so background work never floods WeatherAPI
+_backfill_slots = asyncio.Semaphore(settings.CLIMATOLOGY_BACKFILL_CONCURRENCY)
+_backfill_tasks: Dict[str, asyncio.Task] = {}
+# City -> time before which it is not backfilled again, set after a run that filled nothing
+_backfill_idle_until: Dict[str, float] = {}
+_forecast_tasks: Dict[str, asyncio.Task] = {}
+
+def split_range(start: date, end: date, today: date) -> Tuple[Optional[Tuple[date, date]], List[Tuple[date, date]]]:
+    """
+    Split a trip into the part covered by the forecast (today .. today + horizon - 1) and the
+    historical parts on either side of it. Returns (forecast_range or None, historical_ranges).
+    """
+    horizon_end = today + timedelta(days=FORECAST_HORIZON_DAYS - 1)
+    forecast_start, forecast_end = max(start, today), min(end, horizon_end)
+    if forecast_start > forecast_end:
+        return None, [(start, end)]
+
+    historical = []
+    if start < forecast_start:
+        historical.append((start, forecast_start - timedelta(days=1)))
+    if end > forecast_end:
+        historical.append((forecast_end + timedelta(days=1), end))
+    return (forecast_start, forecast_end), historical
 
 async def get_weather(city: str, start_date: str, end_date: str) -> dict:
+    """
+    One day-by-day timeline for the trip: forecast where WeatherAPI has one, climatology
+    (or last year's weather) for the rest. Every day carries its "source".
+    """
     today = datetime.today().date()
     start = datetime.strptime(start_date, "%Y-%m-%d").date()
     end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    forecast_range, historical_ranges = split_range(start, end, today)
 
-    try:
-        if (start - today).days <= 14:
-            end = min(end, today + timedelta(days=14))
-            return await fetch_forecast(city, start, end)
-        else:
-            return await fetch_historical(city, start, end)
-    except Exception:
-        return {
-            "city": city,
-            "message": "Weather forecast is only available up to 7 days ahead. Please check again closer to your trip."
-        }
+    # Both portions are fetched at the same time; a failure in one still leaves the other
+    jobs = [fetch_historical(city, first, last) for first, last in historical_ranges]
+    if forecast_range:
+        jobs.append(fetch_forecast(city, *forecast_range))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
 
-async def fetch_forecast(city: str, start: datetime.date, end: datetime.date) -> dict:
+    historical = [result for result in results[:len(historical_ranges)] if isinstance(result, dict)]
+    forecast = {}
+    if forecast_range:
+        if isinstance(results[-1], dict):
+            forecast = results[-1]["forecast"]
+        # Forecast days WeatherAPI did not return (or the whole forecast, if it failed) use history
+        gaps = [day for day in _days(*forecast_range) if day.strftime("%Y-%m-%d") not in forecast]
+        if gaps:
+            try:
+                historical.append(await fetch_historical(city, gaps[0], gaps[-1]))
+            except Exception:
+                pass
+
+    timeline = {}
+    notes = []
+    for day in _days(start, end):
+        key = day.strftime("%Y-%m-%d")
+        if key in forecast:
+            timeline[key] = {**forecast[key], "source": "forecast"}
+            continue
+        for result in historical:
+            if key in result["forecast"]:
+                timeline[key] = {**result["forecast"][key], "source": "historical"}
+                if result["note"] not in notes:
+                    notes.append(result["note"])
+                break
+
+    if not timeline:
+        return _unavailable(city)
+
+    response = {
+        "city": city,
+        "type": timeline_type(timeline),
+        "forecast_until": (today + timedelta(days=FORECAST_HORIZON_DAYS - 1)).strftime("%Y-%m-%d"),
+        "forecast": timeline
+    }
+    if notes:
+        response["note"] = " / ".join(notes)
+    return response
+
+def _unavailable(city: str) -> dict:
+    return {
+        "city": city,
+        "message": "Weather data is unavailable for these dates right now. Please check again later."
+    }
+
+def timeline_type(timeline: Dict[str, dict]) -> str:
+    sources = {day["source"] for day in timeline.values()}
+    return sources.pop() if len(sources) == 1 else "mixed"
+
+def slice_weather(weather: dict, start_date: str, end_date: str) -> dict:
+    """Cut a get_weather result for a longer range down to one trip's dates"""
+    if "forecast" not in weather:
+        return weather
+    timeline = {day: values for day, values in weather["forecast"].items() if start_date <= day <= end_date}
+    if not timeline:
+        return _unavailable(weather["city"])
+    sliced = {**weather, "type": timeline_type(timeline), "forecast": timeline}
+    if sliced["type"] == "forecast":
+        sliced.pop("note", None)
+    return sliced
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+async def _forecast_blob(city: str, days: int) -> dict:
+    """
+    The raw per-day forecast for a city covering at least `days` days from today. Cached once per city
+    so every trip touching the city shares it, and concurrent misses share one request.
+    """
+    cache_key = f"weather:forecast:{normalize_city(city)}"
+    today = date.today().strftime("%Y-%m-%d")
+    cached = await cache_backend.aget(cache_key)
+    if cached and cached["fetched_on"] == today and cached["days"] >= days:
+        return cached["forecast"]
+
+    task_key = f"{cache_key}:{days}"
+    task = _forecast_tasks.get(task_key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_forecast_blob(city, days, cache_key, today))
+        _forecast_tasks[task_key] = task
+        task.add_done_callback(lambda _: _forecast_tasks.pop(task_key, None))
+    return await asyncio.shield(task)
+
+async def _fetch_forecast_blob(city: str, days: int, cache_key: str, today: str) -> dict:
     params = {
         "key": settings.WEATHER_API_KEY,
         "q": city,
-        "days": 14,
+        "days": days,
         "aqi": "no",
         "alerts": "no"
     }
@@ -36,16 +153,27 @@ async def fetch_forecast(city: str, start: datetime.date, end: datetime.date) ->
         response.raise_for_status()
         data = response.json()
 
-    forecast_days = data.get("forecast", {}).get("forecastday", [])
-    forecast_map = {
+    forecast = {
         day["date"]: {
             "avg_temp_c": day["day"]["avgtemp_c"],
             "condition": day["day"]["condition"]["text"],
             "max_wind_kph": day["day"]["maxwind_kph"],
             "humidity": day["day"]["avghumidity"]
         }
-        for day in forecast_days
-        if start <= datetime.strptime(day["date"], "%Y-%m-%d").date() <= end
+        for day in data.get("forecast", {}).get("forecastday", [])
+    }
+    await cache_backend.aset(cache_key, {"fetched_on": today, "days": days, "forecast": forecast},
+                      ttl=settings.WEATHER_FORECAST_TTL_SECONDS)
+    return forecast
+
+async def fetch_forecast(city: str, start: datetime.date, end: datetime.date) -> dict:
+    # WeatherAPI counts `days` from today, so ask for exactly as far as the trip needs
+    days = min((end - date.today()).days + 1, FORECAST_HORIZON_DAYS)
+    blob = await _forecast_blob(city, max(days, 1))
+    forecast_map = {
+        day: values
+        for day, values in blob.items()
+        if start <= datetime.strptime(day, "%Y-%m-%d").date() <= end
     }
 
     return {
@@ -54,39 +182,125 @@ async def fetch_forecast(city: str, start: datetime.date, end: datetime.date) ->
         "forecast": forecast_map
     }
 
+def _last_year(day: date) -> date:
+    # Feb 29 has no counterpart in the previous year
+    if day.month == 2 and day.day == 29:
+        return day.replace(year=day.year - 1, day=28)
+    return day.replace(year=day.year - 1)
+
+async def fetch_history_day(client: httpx.AsyncClient, city: str, day: date) -> Optional[dict]:
+    params = {
+        "key": settings.WEATHER_API_KEY,
+        "q": city,
+        "dt": day.strftime("%Y-%m-%d")
+    }
+    try:
+        response = await client.get(HISTORICAL_API_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        return None
+
+    day_data = (data.get("forecast", {}).get("forecastday") or [{}])[0].get("day", {})
+    if day_data.get("avgtemp_c") is None:
+        return None
+    return {
+        "avg_temp_c": day_data.get("avgtemp_c"),
+        "condition": day_data.get("condition", {}).get("text", "No data"),
+        "max_wind_kph": day_data.get("maxwind_kph"),
+        "humidity": day_data.get("avghumidity")
+    }
+
+async def backfill_city(city: str, years: Optional[int] = None) -> int:
+    """Fill the climatology store with the last `years` full calendar years for a city. Returns days fetched."""
+    years = years or settings.CLIMATOLOGY_YEARS
+    record = climatology_store.get(city)
+    this_year = date.today().year
+    # Days that failed recently (no access to older history, not archived yet...) are left for a later run
+    missing = record.missing_days(date(this_year - years, 1, 1), date(this_year - 1, 12, 31),
+                                  retry_after=settings.CLIMATOLOGY_RETRY_SECONDS)
+    filled = 0
+
+    async def fill(client: httpx.AsyncClient, day: date) -> None:
+        nonlocal filled
+        async with _backfill_slots:
+            values = await fetch_history_day(client, city, day)
+        if values:
+            record.record(day, values)
+            filled += 1
+        else:
+            record.mark_failed(day)
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        # Save after every batch so a restart resumes instead of starting over
+        for offset in range(0, len(missing), BACKFILL_BATCH_DAYS):
+            batch = missing[offset:offset + BACKFILL_BATCH_DAYS]
+            await asyncio.gather(*(fill(client, day) for day in batch))
+            climatology_store.save(city)
+    return filled
+
+def schedule_backfill(city: str) -> None:
+    """Start a background backfill for a city unless one is already running or the last one made no progress"""
+    key = normalize_city(city)
+    task = _backfill_tasks.get(key)
+    if task and not task.done():
+        return
+    if _backfill_idle_until.get(key, 0) > time.time():
+        return
+    task = asyncio.create_task(backfill_city(city))
+    _backfill_tasks[key] = task
+    task.add_done_callback(lambda done: _backfill_finished(key, done))
+
+def _backfill_finished(key: str, task: asyncio.Task) -> None:
+    _backfill_tasks.pop(key, None)
+    if task.cancelled() or task.exception() is not None or task.result() == 0:
+        _backfill_idle_until[key] = time.time() + settings.CLIMATOLOGY_RETRY_SECONDS
+    else:
+        _backfill_idle_until.pop(key, None)
+
 async def fetch_historical(city: str, start: datetime.date, end: datetime.date) -> dict:
-    historic_start = start.replace(year=start.year - 1)
-    historic_end = end.replace(year=end.year - 1)
-    results = {}
+    averaged = climatology_store.lookup(city, start, end)
+    if averaged is not None:
+        return {
+            "city": city,
+            "type": "historical",
+            "note": "Average weather for these dates over previous years (for reference)",
+            "forecast": averaged
+        }
+
+    # Not backfilled yet: fetch last year's matching days now and keep them
+    record = climatology_store.get(city)
+    trip_days = _days(start, end)
+    days = [_last_year(day) for day in trip_days]
+
+    slots = asyncio.Semaphore(settings.CLIMATOLOGY_BACKFILL_CONCURRENCY)
+
+    async def fetch_day(client: httpx.AsyncClient, day: date) -> Optional[dict]:
+        stored = record.get_day(day)
+        if stored is not None:
+            return stored
+        async with slots:
+            return await fetch_history_day(client, city, day)
 
     async with httpx.AsyncClient() as client:
-        current_date = historic_start
-        while current_date <= historic_end:
-            params = {
-                "key": settings.WEATHER_API_KEY,
-                "q": city,
-                "dt": current_date.strftime("%Y-%m-%d")
+        fetched = await asyncio.gather(*(fetch_day(client, day) for day in days))
+
+    # Keyed by the trip's own dates so the result lines up with forecast days
+    results = {}
+    for trip_day, day, values in zip(trip_days, days, fetched):
+        if values:
+            record.record(day, values)
+            results[trip_day.strftime("%Y-%m-%d")] = {field: values.get(field) for field in DAY_FIELDS}
+        else:
+            record.mark_failed(day)
+            results[trip_day.strftime("%Y-%m-%d")] = {
+                "avg_temp_c": None,
+                "condition": "No data",
+                "max_wind_kph": None,
+                "humidity": None
             }
-            try:
-                response = await client.get(HISTORICAL_API_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                day_data = data.get("forecast", {}).get("forecastday", [{}])[0].get("day", {})
-                results[current_date.strftime("%Y-%m-%d")] = {
-                    "avg_temp_c": day_data.get("avgtemp_c"),
-                    "condition": day_data.get("condition", {}).get("text", "No data"),
-                    "max_wind_kph": day_data.get("max_wind_kph"),
-                    "humidity": day_data.get("avghumidity")
-                }
-            except Exception:
-                results[current_date.strftime("%Y-%m-%d")] = {
-                    "avg_temp_c": None,
-                    "condition": "No data",
-                    "max_wind_kph": None,
-                    "humidity": None
-                }
-            current_date += timedelta(days=1)
+    climatology_store.save(city)
+    schedule_backfill(city)
 
     return {
         "city": city,
@@ -0,0 +1,214 @@
+import asyncio
+import ipaddress
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+MAX_CLIENT_BUCKETS = 10000
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in settings.ADMISSION_TRUSTED_PROXIES.split(",")
+    if proxy.strip()
+]
+
+
+@dataclass
+class EndpointPolicy:
+    max_concurrency: int
+    max_queue: int
+    latency_slo: float  # longest a request may wait for a slot, in seconds
+    expected_service_time: float  # seed for the service-time estimate, in seconds
+    rate_per_minute: float = 0  # per client, 0 disables rate limiting
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def idle(self, now: float) -> bool:
+        """Full again since its last use, so forgetting it changes nothing"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def take(self) -> float:
+        """Consume a token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class EndpointGate:
+    """Concurrency limit with a bounded FIFO wait queue, rejecting early when the queue would miss its SLO"""
+
+    def __init__(self, name: str, policy: EndpointPolicy):
+        self.name = name
+        self.policy = policy
+        self.active = 0
+        self.waiters: deque = deque()
+        self.service_time = policy.expected_service_time
+        # Least recently seen client first
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def estimated_wait(self) -> float:
+        if self.active < self.policy.max_concurrency:
+            return 0.0
+        # Each slot frees up roughly once per service time; we are behind everyone already queued
+        return (len(self.waiters) + 1) * self.service_time / self.policy.max_concurrency
+
+    def check_rate(self, client: str) -> None:
+        if not self.policy.rate_per_minute:
+            return
+        now = time.monotonic()
+        bucket = self.buckets.pop(client, None) or TokenBucket(self.policy.rate_per_minute)
+        self.buckets[client] = bucket
+        # Evict from the least recently seen end: idle buckets, and the oldest ones past the cap
+        while self.buckets:
+            oldest = next(iter(self.buckets.values()))
+            if oldest is bucket or not (len(self.buckets) > MAX_CLIENT_BUCKETS or oldest.idle(now)):
+                break
+            self.buckets.popitem(last=False)
+        wait = bucket.take()
+        if wait:
+            raise Rejected(429, f"Rate limit exceeded for {self.name}", wait)
+
+    async def acquire(self) -> None:
+        if self.active < self.policy.max_concurrency and not self.waiters:
+            self.active += 1
+            return
+
+        wait = self.estimated_wait()
+        if len(self.waiters) >= self.policy.max_queue or wait > self.policy.latency_slo:
+            raise Rejected(503, f"{self.name} is at capacity, please retry later", wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.policy.latency_slo)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we gave up; pass it on
+                self.release(None)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected(503, f"{self.name} queue deadline exceeded", self.estimated_wait())
+            raise
+
+    def release(self, service_time: Optional[float]) -> None:
+        if service_time is not None:
+            # Exponentially weighted moving average keeps the estimate responsive to load changes
+            self.service_time = 0.8 * self.service_time + 0.2 * service_time
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter, active count stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_key(scope: Scope) -> str:
+    """
+    The peer address. X-Forwarded-For is only believed when the peer is one of our proxies, and then
+    only up to the first hop our proxies did not add; anything a client sends itself is ignored.
+    """
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if _trusted(address):
+        forwarded = Headers(scope=scope).get("x-forwarded-for", "")
+        for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+            address = hop
+            if not _trusted(hop):
+                break
+    return f"ip:{address}"
+
+
+class AdmissionMiddleware:
+    """
+    Gate expensive endpoints before they occupy a worker. Paths without a policy
+    (cheap reads such as GET /trip/{trip_id}) pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, gates: Dict[str, EndpointGate]):
+        self.app = app
+        self.gates: Dict[Tuple[str, str], EndpointGate] = {}
+        for route, gate in gates.items():
+            method, _, path = route.partition(" ")
+            self.gates[(method, path)] = gate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        gate = self.gates.get((scope.get("method", ""), scope.get("path", ""))) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            gate.check_rate(client_key(scope))
+            await gate.acquire()
+        except Rejected as e:
+            response = ORJSONResponse(
+                {"detail": e.detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - started)
+
+
+def llm_policy() -> EndpointPolicy:
+    return EndpointPolicy(
+        max_concurrency=settings.ADMISSION_LLM_CONCURRENCY,
+        max_queue=settings.ADMISSION_LLM_QUEUE,
+        latency_slo=settings.ADMISSION_LLM_SLO_SECONDS,
+        expected_service_time=settings.ADMISSION_LLM_EXPECTED_SECONDS,
+        rate_per_minute=settings.ADMISSION_LLM_RATE_PER_MINUTE,
+    )
+
+
+# Shared with the WebSocket conversation channel, which runs the same model calls as POST /conversation
+conversation_gate = EndpointGate("/conversation", llm_policy())
+
+
+def default_gates(prefix: str) -> Dict[str, EndpointGate]:
+    """One gate per LLM-heavy endpoint so a spike on one does not starve the others"""
+    return {
+        f"POST {prefix}/conversation": conversation_gate,
+        f"POST {prefix}/itinerary": EndpointGate("/itinerary", llm_policy()),
+        f"POST {prefix}/route-summary": EndpointGate("/route-summary", llm_policy()),
+    }
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+PROFILE_SUFFIX = ".folded"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ";" separates frames in the folded format, keep it out of labels
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class TaskSampler:
+    """
+    Samples the stack of one asyncio task from a background thread.
+    When the task is running we record the event-loop thread's real stack (CPU time); when it is
+    suspended we record its coroutine chain ending in an "<await ...>" frame (I/O and other waits).
+    """
+
+    def __init__(self, task: asyncio.Task, thread_id: int, interval: float, root_code=None):
+        self.task = task
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_code = root_code
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                stack = self._sample()
+            except Exception:
+                continue  # The task mutated under us, skip this tick
+            if stack:
+                self.samples[";".join(stack)] += 1
+
+    def _coroutine_chain(self):
+        frames = []
+        awaited = self.task.get_coro()
+        while awaited is not None:
+            if isinstance(awaited, asyncio.Task):
+                awaited = awaited.get_coro()
+            frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None)
+            if frame is None:
+                break
+            frames.append(frame)
+            awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None)
+        return frames, awaited
+
+    def _sample(self) -> List[str]:
+        frames, awaited = self._coroutine_chain()
+        if not frames:
+            return []
+
+        thread_stack = []
+        frame = sys._current_frames().get(self.thread_id)
+        while frame is not None:
+            thread_stack.append(frame)
+            frame = frame.f_back
+
+        innermost = frames[-1]
+        suffix = []
+        if innermost in thread_stack:
+            # Running: a running coroutine exposes no cr_await, so the thread stack below it is the rest of the chain
+            frames = frames + list(reversed(thread_stack[:thread_stack.index(innermost)]))
+        else:
+            suffix = [f"<await {type(awaited).__name__}>" if awaited is not None else "<await>"]
+
+        if self.root_code is not None:
+            for index, frame in enumerate(frames):
+                if frame.f_code is self.root_code:
+                    frames = frames[index + 1:]
+                    break
+        return [_frame_label(frame) for frame in frames] + suffix
+
+
+def _safe_request_id(value: Optional[str]) -> str:
+    if value and re.fullmatch(r"[A-Za-z0-9_-]{1,64}", value):
+        return value
+    return uuid.uuid4().hex
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profiling, enabled by an `X-Profile: <PROFILE_TOKEN>` header or by
+    PROFILE_SAMPLE_RATE. Only installed when one of them is configured, so it costs nothing otherwise.
+    """
+
+    def __init__(self, app: ASGIApp, token: str, sample_rate: float, interval: float, directory: str,
+                 max_profiles: int = 200):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _authorized(self, headers: Headers) -> bool:
+        return bool(self.token) and headers.get("x-profile") == self.token
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        authorized = self._authorized(headers)
+        if not authorized and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        # Only token holders pick the file name; sampled clients must not be able to overwrite a profile
+        request_id = _safe_request_id(headers.get("x-request-id") if authorized else None)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = request_id
+            await send(message)
+
+        sampler = TaskSampler(
+            asyncio.current_task(), threading.get_ident(), self.interval, root_code=ProfilingMiddleware.__call__.__code__
+        )
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self._write(request_id, sampler.samples)
+
+    def _write(self, request_id: str, samples: Counter) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{request_id}{PROFILE_SUFFIX}")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune()
+
+    def _prune(self) -> None:
+        """Keep only the newest max_profiles profiles"""
+        profiles = [entry for entry in os.scandir(self.directory) if entry.name.endswith(PROFILE_SUFFIX)]
+        if len(profiles) <= self.max_profiles:
+            return
+        profiles.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in profiles[:len(profiles) - self.max_profiles]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # Another worker pruned it first
+
+
+router = APIRouter()
+
+
+def _require_admin(token: Optional[str]) -> None:
+    if not settings.PROFILE_TOKEN or token != settings.PROFILE_TOKEN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+
+@router.get("/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return {"profiles": []}
+    names = sorted(
+        (entry for entry in os.scandir(settings.PROFILE_DIR) if entry.name.endswith(PROFILE_SUFFIX)),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    return {"profiles": [entry.name[:-len(PROFILE_SUFFIX)] for entry in names]}
+
+
+@router.get("/profiles/{request_id}")
+def get_profile(request_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Folded stacks, loadable by flamegraph.pl, speedscope or inferno"""
+    _require_admin(x_admin_token)
+    if _safe_request_id(request_id) != request_id:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(settings.PROFILE_DIR, f"{request_id}{PROFILE_SUFFIX}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path, "r") as f:
+        content = f.read()
+    return PlainTextResponse(
+        content,
+        headers={"Content-Disposition": f'attachment; filename="{request_id}{PROFILE_SUFFIX}"'},
+    )
@@ -1,19 +1,25 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.agents.weather_agent import get_weather
 from app.core.logic import generate_trip_plan
-from app.llm.extract_trip_info import extract_trip_info_from_prompt, chat_manager
-from app.agents.foursquare_agent import get_places
-from app.core.trip_storage import trip_storage
-from typing import Optional
-from datetime import datetime
+from app.llm.extract_trip_info import extract_trip_info_from_prompt, chat_manager, get_extraction_metrics
+from app.agents.places_service import get_places_for_city, search_nearby, search_bbox
+from app.core.trip_storage import trip_storage, ChangesExpired
+from typing import List, Optional
 from app.core.trip_storage import TripStorage;
 from app.llm.itinerary import get_itinerary_response
 from app.core.route_summary import get_route_summary
-from app.agents.flight_agent import get_flight_offers
-import json
+from app.core.day_planner import plan_days
+from app.core.sections import weather_section, flights_section, places_section, missing_fields, SECTIONS
+from app.core.bulk_enrichment import BulkEnrichment
+import gzip
+import logging
+import orjson
+from app.api.http_cache import conditional_response, make_etag, to_http_datetime, latest_timestamp
+from app.config import settings
 
-# from app.config import settings
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -38,59 +44,120 @@ class ItineraryRequest(BaseModel):
     start_date: str
     end_date: str
 
+class ItineraryPlanRequest(BaseModel):
+    trip_id: str
+    narrate: bool = True
+
+class BulkEnrichmentRequest(BaseModel):
+    trip_ids: List[str]
+    sections: List[str] = ["weather", "flights", "places"]
+
 class RouteRequest(BaseModel):
     source: str
     destination: str
 
 
 @router.post("/conversation")
-def conversation(request: ConversationRequest):
+async def conversation(request: ConversationRequest):
     if request.reset and request.trip_id:
         chat_manager.close_chat(request.trip_id)
         return {"message": "Conversation reset successfully"}
     
-    # Extract trip info from prompt with trip_id
-    trip_data = extract_trip_info_from_prompt(request.prompt, request.trip_id)
+    # Extract trip info from prompt with trip_id (blocking Gemini call, kept off the event loop)
+    trip_data = await run_in_threadpool(extract_trip_info_from_prompt, request.prompt, request.trip_id)
     
     # If we have a trip_id, handle storage
     if request.trip_id:
-        existing_trip = trip_storage.get_trip(request.trip_id)
-        if existing_trip:
-            if not trip_storage.update_trip(request.trip_id, trip_data):
-                raise HTTPException(status_code=500, detail="Failed to update trip")
-        else:
-            # Create new trip with the provided trip_id
-            trip_storage.trip_data[request.trip_id] = {
-                "data": trip_data,
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            }
-            trip_storage._save_data()
+        await trip_storage.aupsert_trip(request.trip_id, trip_data)
         return {"trip_id": request.trip_id, **trip_data}
     
     # If trip is complete or user explicitly confirms completion
     if trip_data.get("is_complete", False) or "complete" in request.prompt.lower():
-        trip_id = trip_storage.create_trip(trip_data)
+        trip_id = await trip_storage.acreate_trip(trip_data)
         return {"trip_id": trip_id, **trip_data}
     
     return trip_data
 
+async def get_trip_data(trip_id: str) -> dict:
+    trip = await trip_storage.aget_trip(trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip["data"]
+
+@router.get("/metrics/extraction")
+def extraction_metrics():
+    return get_extraction_metrics()
+
 @router.get("/trip/{trip_id}")
-def get_trip(trip_id: str):
-    trip = trip_storage.get_trip(trip_id)
+async def get_trip(trip_id: str, request: Request):
+    trip = await trip_storage.aget_trip(trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
-    return trip
+    # updated_at changes on every write, so it is a cheap version marker for the whole record
+    etag = make_etag(trip_id, trip.get("updated_at", ""))
+    return conditional_response(request, trip, etag, to_http_datetime(trip.get("updated_at")))
 
 @router.delete("/trip/{trip_id}")
-def delete_trip(trip_id: str):
-    if not trip_storage.delete_trip(trip_id):
+async def delete_trip(trip_id: str):
+    if not await trip_storage.adelete_trip(trip_id):
         raise HTTPException(status_code=404, detail="Trip not found")
     return {"message": "Trip deleted successfully"}
 
 @router.get("/trips")
-def get_all_trips():
-    return trip_storage.get_all_trips()
+async def get_all_trips(request: Request):
+    trips = await trip_storage.aget_all_trips()
+    versions = sorted((trip_id, trip.get("updated_at", "")) for trip_id, trip in trips.items())
+    etag = make_etag(*(f"{trip_id}@{updated_at}" for trip_id, updated_at in versions))
+    last_modified = latest_timestamp(updated_at for _, updated_at in versions)
+    return conditional_response(request, trips, etag, last_modified)
+
+@router.get("/trips/changes")
+async def trip_changes(cursor: int = 0, timeout: float = 0, limit: int = 500):
+    # Long-poll: with a timeout the request is held until a change after the cursor is durable
+    timeout = min(max(timeout, 0), settings.TRIP_CHANGES_MAX_WAIT_SECONDS)
+    try:
+        changes = await trip_storage.wait_for_changes(cursor, timeout, limit)
+    except ChangesExpired as e:
+        raise HTTPException(status_code=410, detail=f"{e}. Re-sync from /trips/snapshot")
+    return {"changes": changes, "cursor": changes[-1]["seq"] if changes else cursor}
+
+@router.get("/trips/changes/stream")
+async def trip_changes_stream(cursor: int = 0):
+    # Fail with a proper status before the stream starts
+    try:
+        await trip_storage.changes_since(cursor, limit=1)
+    except ChangesExpired as e:
+        raise HTTPException(status_code=410, detail=f"{e}. Re-sync from /trips/snapshot")
+
+    async def ndjson(cursor: int):
+        while True:
+            try:
+                changes = await trip_storage.wait_for_changes(cursor, settings.TRIP_CHANGES_MAX_WAIT_SECONDS)
+            except ChangesExpired as e:
+                yield orjson.dumps({"type": "expired", "detail": str(e)}) + b"\n"
+                return
+            for change in changes:
+                yield orjson.dumps({"type": "change", **change}) + b"\n"
+            if changes:
+                cursor = changes[-1]["seq"]
+            else:
+                # Keeps proxies from closing an idle connection and tells the client where it is
+                yield orjson.dumps({"type": "heartbeat", "cursor": cursor}) + b"\n"
+
+    return StreamingResponse(ndjson(cursor), media_type="application/x-ndjson")
+
+@router.get("/trips/snapshot")
+async def trip_snapshot():
+    snapshot = await trip_storage.asnapshot()
+    body = await run_in_threadpool(lambda: gzip.compress(orjson.dumps(snapshot), compresslevel=6))
+    return Response(
+        content=body,
+        media_type="application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="trips-snapshot-{snapshot["cursor"]}.json.gz"',
+            "X-Change-Cursor": str(snapshot["cursor"])
+        }
+    )
 
 @router.post("/plan-trip")
 def plan_trip(request: TripRequest):
@@ -100,46 +167,54 @@ def plan_trip(request: TripRequest):
 @router.post("/smart-weather")
 async def weather_from_prompt(TripInfoWrapper: TripInfoWrapper):
     trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    # Get weather for both origin and destination
-    origin_weather = await get_weather(trip_data["origin"], trip_data["start_date"], trip_data["end_date"])
-    dest_weather = await get_weather(trip_data["destination"], trip_data["start_date"], trip_data["end_date"])
-
-    return {
-        "origin_weather": origin_weather,
-        "destination_weather": dest_weather,
-        "trip_dates": {
-            "start": trip_data["start_date"],
-            "end": trip_data["end_date"]
-        }
-    }
+    trip_data = await get_trip_data(trip_id)
+    return await weather_section(trip_data)
 
 @router.post("/top-places")
 async def top_places(TripInfoWrapper: TripInfoWrapper):
     trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
-
+    trip_data = await get_trip_data(trip_id)
     try:
         city = trip_data["destination"]
-        places = await get_places(city, category="attractions")
+        places = (await get_places_for_city(city, categories=("attractions",)))["attractions"]
         return {"city": city, "places_to_visit": places}
     except Exception as e:
         return {"error": str(e)}
 
+@router.post("/places")
+async def all_places(TripInfoWrapper: TripInfoWrapper):
+    trip_id = TripInfoWrapper.trip_id
+    trip_data = await get_trip_data(trip_id)
+    try:
+        return await places_section(trip_data)
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.get("/places/search")
+def places_search(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: float = 2.0,
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    category: Optional[str] = None
+):
+    # Served from the local index of already-fetched places, never from Foursquare
+    if None not in (min_lat, min_lng, max_lat, max_lng):
+        return {"places": search_bbox(min_lat, min_lng, max_lat, max_lng, category)}
+    if lat is not None and lng is not None:
+        return {"places": search_nearby(lat, lng, radius_km, category)}
+    raise HTTPException(status_code=400, detail="Provide lat/lng (with radius_km) or min_lat/min_lng/max_lat/max_lng")
+
 @router.post("/restaurants")
 async def restaurants(TripInfoWrapper: TripInfoWrapper):
     trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
+    trip_data = await get_trip_data(trip_id)
     try:
         city = trip_data["destination"]
-        results = await get_places(city, category="restaurants")
+        results = (await get_places_for_city(city, categories=("restaurants",)))["restaurants"]
         return {"city": city, "restaurants": results}
     except Exception as e:
         return {"error": str(e)}
@@ -147,9 +222,7 @@ async def restaurants(TripInfoWrapper: TripInfoWrapper):
 @router.post("/route-summary")
 async def route_summary(TripInfoWrapper: TripInfoWrapper):
     trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
+    trip_data = await get_trip_data(trip_id)
     try:
         result = await get_route_summary(trip_data["origin"], trip_data["destination"])
         # result = get_route_summary(req.source, req.destination)
@@ -160,12 +233,10 @@ async def route_summary(TripInfoWrapper: TripInfoWrapper):
 @router.post("/hotels")
 async def hotels(TripInfoWrapper: TripInfoWrapper):
     trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
+    trip_data = await get_trip_data(trip_id)
     try:
         city = trip_data["destination"]
-        results = await get_places(city, category="hotels")
+        results = (await get_places_for_city(city, categories=("hotels",)))["hotels"]
         return {"city": city, "hotels": results}
     except Exception as e:
         # More informative error handling
@@ -182,52 +253,54 @@ async def hotels(TripInfoWrapper: TripInfoWrapper):
         return {"error": f"{error_type}: {error_message}"}
     
 @router.post("/itinerary")
-async def itinerary(TripInfoWrapper: TripInfoWrapper):
-    trip_id = TripInfoWrapper.trip_id
-    trip_data = get_trip(trip_id)['data']
-    if not trip_data:
-        raise HTTPException(status_code=404, detail="Trip not found")
+async def itinerary(request: ItineraryPlanRequest):
+    trip_data = await get_trip_data(request.trip_id)
     try:
-        itinerary_text = await get_itinerary_response(trip_data)
-        return {"itinerary": itinerary_text}
+        plan = None
+        try:
+            places = await get_places_for_city(trip_data["destination"], limit=settings.ITINERARY_PLACES_LIMIT)
+            plan = plan_days(trip_data, places)
+        except Exception as e:
+            logger.warning("Day planner unavailable for trip %s: %s", request.trip_id, e)
+        if plan and not any(day["stops"] for day in plan["days"]):
+            logger.info("Day planner found no attractions for trip %s", request.trip_id)
+            plan = None
+        # Without a usable plan we fall back to a fully generated itinerary
+
+        if plan and not request.narrate:
+            return {"plan": plan}
+        itinerary_text = await get_itinerary_response(trip_data, plan)
+        return {"itinerary": itinerary_text, "plan": plan}
     except Exception as e:
         return {"error": str(e)}
 
+@router.post("/bulk-enrichment")
+async def bulk_enrichment(request: BulkEnrichmentRequest):
+    unknown = [section for section in request.sections if section not in SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    trips = {trip_id: await trip_storage.aget_trip(trip_id) for trip_id in dict.fromkeys(request.trip_ids)}
+    enrichment = BulkEnrichment(settings.BULK_CONCURRENCY)
+
+    async def ndjson():
+        async for item in enrichment.stream(trips, request.sections):
+            yield orjson.dumps(item) + b"\n"
+
+    # One JSON object per line, each trip is sent as soon as its upstream keys are done
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.post("/search-flights")
 async def search_flights(TripInfoWrapper: TripInfoWrapper):
-    trip_id = TripInfoWrapper.trip_id
+    trip_info = await get_trip_data(TripInfoWrapper.trip_id)
+
+    # Validate required fields
+    missing = missing_fields(trip_info)
+    if missing:
+        raise HTTPException(status_code=500, detail=f"Missing required field: {missing[0]}")
+
     try:
-        # Read trip data
-        with open("trip_data.json", "r") as file:
-            trips_data = json.load(file)
-        
-        # Check if trip_id exists in the data
-        if trip_id not in trips_data:
-            raise HTTPException(status_code=404, detail="Trip not found")
-        
-        # Get the trip data
-        trip = trips_data[trip_id]
-        trip_info = trip["data"]
-        
-        # Validate required fields
-        required_fields = ["origin", "destination", "start_date", "end_date"]
-        for field in required_fields:
-            if field not in trip_info:
-                raise HTTPException(status_code=500, detail=f"Missing required field: {field}")
-        
-        # Get flight offers
-        flight_offers = await get_flight_offers(
-            origin=trip_info["origin"],
-            destination=trip_info["destination"],
-            departure_date=trip_info["start_date"],
-            return_date=trip_info["end_date"]
-        )
-        
-        return flight_offers
-        
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Invalid JSON data in trip_data.json")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="trip_data.json file not found")
+        return await flights_section(trip_info)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from app.api.admission import Rejected, client_key, conversation_gate
+from app.core.sections import SECTIONS, missing_fields
+from app.core.trip_storage import trip_storage
+from app.llm.extract_trip_info import chat_manager, stream_trip_info_from_prompt
+
+router = APIRouter()
+
+
+class ConversationSession:
+    """
+    One conversation per WebSocket connection.
+
+    Client messages:  {"type": "message", "prompt": "..."}  |  {"type": "reset"}
+    Server messages:  session, follow_up_delta, trip, section, section_error, error
+    """
+
+    def __init__(self, websocket: WebSocket, trip_id: str):
+        self.websocket = websocket
+        self.trip_id = trip_id
+        self.send_lock = asyncio.Lock()
+        self.section_tasks: Dict[str, asyncio.Task] = {}
+
+    async def send(self, message: dict) -> None:
+        # Section tasks and the conversation loop share the socket
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    async def handle_prompt(self, prompt: str) -> None:
+        # Same concurrency, queueing and per-client rate limits as POST /conversation
+        try:
+            conversation_gate.check_rate(client_key(self.websocket.scope))
+            await conversation_gate.acquire()
+        except Rejected as e:
+            await self.send({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+            return
+        started = time.monotonic()
+        try:
+            await self.run_prompt(prompt)
+        finally:
+            conversation_gate.release(time.monotonic() - started)
+
+    async def run_prompt(self, prompt: str) -> None:
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+
+        def on_follow_up(text: str) -> None:
+            loop.call_soon_threadsafe(deltas.put_nowait, text)
+
+        def run_model() -> dict:
+            try:
+                return stream_trip_info_from_prompt(prompt, self.trip_id, on_follow_up)
+            finally:
+                loop.call_soon_threadsafe(deltas.put_nowait, None)
+
+        # The Gemini client is blocking, so it streams from a worker thread into the queue
+        result = loop.run_in_executor(None, run_model)
+        while (delta := await deltas.get()) is not None:
+            await self.send({"type": "follow_up_delta", "text": delta})
+
+        try:
+            trip_data = dict(await result)
+        except HTTPException as e:
+            await self.send({"type": "error", "detail": e.detail})
+            return
+        except Exception as e:
+            await self.send({"type": "error", "detail": str(e)})
+            return
+
+        await trip_storage.aupsert_trip(self.trip_id, trip_data)
+        await self.send({"type": "trip", "trip_id": self.trip_id, "data": trip_data})
+
+        if trip_data.get("is_complete") and not missing_fields(trip_data):
+            self.start_sections(trip_data)
+
+    def start_sections(self, trip_data: dict) -> None:
+        # Restart enrichment from scratch whenever the trip details change
+        self.cancel_sections()
+        for name, build in SECTIONS.items():
+            self.section_tasks[name] = asyncio.create_task(self.push_section(name, build, trip_data))
+
+    async def push_section(self, name: str, build, trip_data: dict) -> None:
+        try:
+            data = await build(trip_data)
+        except Exception as e:
+            await self.send({"type": "section_error", "section": name, "detail": str(e)})
+            return
+        await self.send({"type": "section", "section": name, "trip_id": self.trip_id, "data": data})
+
+    def cancel_sections(self) -> None:
+        for task in self.section_tasks.values():
+            task.cancel()
+        self.section_tasks = {}
+
+    async def run(self) -> None:
+        await self.send({"type": "session", "trip_id": self.trip_id})
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    message = {}
+                if message.get("type") == "reset":
+                    self.cancel_sections()
+                    chat_manager.close_chat(self.trip_id)
+                    await self.send({"type": "reset", "trip_id": self.trip_id})
+                elif message.get("type") == "message" and message.get("prompt"):
+                    await self.handle_prompt(message["prompt"])
+                else:
+                    await self.send({"type": "error", "detail": "Expected {\"type\": \"message\", \"prompt\": ...} or {\"type\": \"reset\"}"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.cancel_sections()
+
+
+@router.websocket("/ws/conversation")
+async def conversation_socket(websocket: WebSocket, trip_id: Optional[str] = None):
+    await websocket.accept()
+    await ConversationSession(websocket, trip_id or str(uuid.uuid4())).run()
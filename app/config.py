@@ -11,6 +11,31 @@ class Settings(BaseSettings):
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     AMADEUS_API_KEY: str = os.getenv("AMADEUS_API_KEY", "")
     AMADEUS_API_SECRET: str = os.getenv("AMADEUS_API_SECRET", "")
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    CLIMATOLOGY_DIR: str = os.getenv("CLIMATOLOGY_DIR", "climatology_data")
+    CLIMATOLOGY_YEARS: int = int(os.getenv("CLIMATOLOGY_YEARS", "3"))
+    CLIMATOLOGY_BACKFILL_CONCURRENCY: int = int(os.getenv("CLIMATOLOGY_BACKFILL_CONCURRENCY", "4"))
+    CLIMATOLOGY_RETRY_SECONDS: int = int(os.getenv("CLIMATOLOGY_RETRY_SECONDS", "86400"))
+    WEATHER_FORECAST_TTL_SECONDS: int = int(os.getenv("WEATHER_FORECAST_TTL_SECONDS", "1800"))
+    PLACES_TILE_DEGREES: float = float(os.getenv("PLACES_TILE_DEGREES", "0.05"))
+    PLACES_RADIUS_M: int = int(os.getenv("PLACES_RADIUS_M", "10000"))
+    ITINERARY_PLACES_LIMIT: int = int(os.getenv("ITINERARY_PLACES_LIMIT", "15"))
+    BULK_CONCURRENCY: int = int(os.getenv("BULK_CONCURRENCY", "8"))
+    TRIP_FLUSH_DELAY_MS: float = float(os.getenv("TRIP_FLUSH_DELAY_MS", "5"))
+    TRIP_CHANGES_RETAIN: int = int(os.getenv("TRIP_CHANGES_RETAIN", "10000"))
+    TRIP_CHANGES_MAX_WAIT_SECONDS: float = float(os.getenv("TRIP_CHANGES_MAX_WAIT_SECONDS", "30"))
+    SHARED_CACHE_SOCKET: str = os.getenv("SHARED_CACHE_SOCKET", "")
+    PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "200"))
+    ADMISSION_LLM_CONCURRENCY: int = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "4"))
+    ADMISSION_LLM_QUEUE: int = int(os.getenv("ADMISSION_LLM_QUEUE", "16"))
+    ADMISSION_LLM_SLO_SECONDS: float = float(os.getenv("ADMISSION_LLM_SLO_SECONDS", "10"))
+    ADMISSION_LLM_EXPECTED_SECONDS: float = float(os.getenv("ADMISSION_LLM_EXPECTED_SECONDS", "3"))
+    ADMISSION_LLM_RATE_PER_MINUTE: float = float(os.getenv("ADMISSION_LLM_RATE_PER_MINUTE", "30"))
+    ADMISSION_TRUSTED_PROXIES: str = os.getenv("ADMISSION_TRUSTED_PROXIES", "")  # comma-separated IPs/CIDRs of our reverse proxies
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from app.agents.flight_agent import get_flight_offers
+from app.agents.places_service import get_places_for_city
+from app.agents.weather_agent import get_weather, slice_weather
+from app.core.cities import normalize_city
+from app.core.sections import SECTIONS, missing_fields, places_payload, weather_payload
+
+
+def _next_day(day: str) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+class BulkEnrichment:
+    """
+    Enrich many trips at once. Upstream work is planned as a set of distinct keys
+    (city weather over merged date ranges, route/date flights, city places) so trips sharing a key
+    share one call, and the keys run with bounded concurrency.
+    """
+
+    def __init__(self, concurrency: int):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.tasks: Dict[tuple, asyncio.Task] = {}
+        # (city key, start, end) of a trip -> the task fetching the merged range that covers it
+        self.weather_tasks: Dict[Tuple[str, str, str], asyncio.Task] = {}
+
+    def _shared(self, key: tuple, factory) -> asyncio.Task:
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._limited(factory))
+        return self.tasks[key]
+
+    async def _limited(self, factory):
+        async with self.slots:
+            return await factory()
+
+    def _plan_weather(self, trips: List[dict]) -> None:
+        """
+        One weather fetch per city over each run of overlapping or adjacent trip dates, so trips to
+        the same city with slightly different dates share a call and each slices out its own days.
+        """
+        spans: Dict[str, List[Tuple[str, str, str]]] = {}
+        for trip_data in trips:
+            for city in (trip_data["origin"], trip_data["destination"]):
+                spans.setdefault(normalize_city(city), []).append((trip_data["start_date"], trip_data["end_date"], city))
+
+        for key, city_spans in spans.items():
+            city_spans.sort()
+            merged: List[List] = []
+            for start, end, city in city_spans:
+                if merged and start <= _next_day(merged[-1][1]):
+                    merged[-1][1] = max(merged[-1][1], end)
+                    merged[-1][3].append((start, end))
+                else:
+                    merged.append([start, end, city, [(start, end)]])
+            for start, end, city, covered in merged:
+                task = self._shared(
+                    ("weather", key, start, end),
+                    lambda city=city, start=start, end=end: get_weather(city, start, end),
+                )
+                for span in covered:
+                    self.weather_tasks[(key, *span)] = task
+
+    def _plan_trip(self, trip_data: dict, sections: Iterable[str]) -> Dict[str, List[asyncio.Task]]:
+        start, end = trip_data["start_date"], trip_data["end_date"]
+        origin, destination = trip_data["origin"], trip_data["destination"]
+        planned = {}
+        if "weather" in sections:
+            planned["weather"] = [
+                self.weather_tasks[(normalize_city(origin), start, end)],
+                self.weather_tasks[(normalize_city(destination), start, end)],
+            ]
+        if "flights" in sections:
+            planned["flights"] = [self._shared(
+                ("flights", normalize_city(origin), normalize_city(destination), start, end),
+                lambda: get_flight_offers(origin=origin, destination=destination,
+                                          departure_date=start, return_date=end),
+            )]
+        if "places" in sections:
+            # One pass fetches every category for the city
+            planned["places"] = [self._shared(
+                ("places", normalize_city(destination)),
+                lambda: get_places_for_city(destination),
+            )]
+        return planned
+
+    @staticmethod
+    async def _collect(trip_id: str, trip_data: dict, planned: Dict[str, List[asyncio.Task]]) -> dict:
+        result = {"type": "trip", "trip_id": trip_id}
+        for section, tasks in planned.items():
+            try:
+                values = [await asyncio.shield(task) for task in tasks]
+            except Exception as e:
+                result[section] = {"error": str(e)}
+                continue
+            if section == "weather":
+                start, end = trip_data["start_date"], trip_data["end_date"]
+                result[section] = weather_payload(
+                    trip_data, slice_weather(values[0], start, end), slice_weather(values[1], start, end)
+                )
+            elif section == "places":
+                result[section] = places_payload(trip_data, values[0])
+            else:
+                result[section] = values[0]
+        return result
+
+    async def stream(self, trips: Dict[str, Optional[dict]], sections: List[str]) -> AsyncIterator[dict]:
+        """Yield a plan summary, then one result per trip as soon as all of its keys are done"""
+        unknown = [section for section in sections if section not in SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(unknown)}")
+
+        valid: Dict[str, dict] = {}
+        immediate = []
+        for trip_id, trip in trips.items():
+            if not trip:
+                immediate.append({"type": "trip", "trip_id": trip_id, "error": "Trip not found"})
+                continue
+            trip_data = trip["data"]
+            missing = missing_fields(trip_data)
+            if missing:
+                immediate.append({"type": "trip", "trip_id": trip_id, "error": f"Missing required fields: {', '.join(missing)}"})
+                continue
+            try:
+                if datetime.strptime(trip_data["end_date"], "%Y-%m-%d") < datetime.strptime(trip_data["start_date"], "%Y-%m-%d"):
+                    raise ValueError
+            except ValueError:
+                immediate.append({"type": "trip", "trip_id": trip_id, "error": "Invalid trip dates"})
+                continue
+            valid[trip_id] = trip_data
+
+        # Weather keys depend on every trip's dates, so they are planned before any trip is
+        if "weather" in sections:
+            self._plan_weather(list(valid.values()))
+        pending = [
+            asyncio.create_task(self._collect(trip_id, trip_data, self._plan_trip(trip_data, sections)))
+            for trip_id, trip_data in valid.items()
+        ]
+
+        key_counts: Dict[str, int] = {}
+        for key in self.tasks:
+            key_counts[key[0]] = key_counts.get(key[0], 0) + 1
+        yield {"type": "plan", "trips": len(trips), "upstream_keys": key_counts}
+
+        try:
+            for item in immediate:
+                yield item
+            for finished in asyncio.as_completed(pending):
+                yield await finished
+            yield {"type": "done"}
+        finally:
+            # Stop remaining upstream work if the client went away mid-stream
+            for task in pending + list(self.tasks.values()):
+                task.cancel()
@@ -0,0 +1,6 @@
+import re
+
+
+def normalize_city(city: str) -> str:
+    """Lowercase and collapse whitespace so trivially different spellings share one cache key or record"""
+    return re.sub(r"\s+", " ", city.strip().lower())
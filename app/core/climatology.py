@@ -0,0 +1,212 @@
+import array
+import base64
+import json
+import math
+import os
+import re
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.core.cities import normalize_city
+
+NUMERIC_FIELDS = ("avg_temp_c", "max_wind_kph", "humidity")
+DAYS_PER_YEAR = 366  # Slots follow a leap-year calendar so Feb 29 has its own index
+FEB_29 = 59
+MISSING = float("nan")
+
+
+def day_slot(day: date) -> int:
+    """Index of a calendar day (month/day only) in a 366-slot year"""
+    return date(2000, day.month, day.day).timetuple().tm_yday - 1
+
+
+def _encode(values: array.array) -> str:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _decode(typecode: str, payload: str) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(base64.b64decode(payload))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class CityClimatology:
+    """Daily historical weather for one city, one fixed-size column per field and year"""
+
+    def __init__(self, city: str):
+        self.city = city
+        self.conditions: List[str] = [""]  # index 0 means "no data"
+        self.years: Dict[int, Dict[str, array.array]] = {}
+        # ISO day -> unix time of the last failed upstream fetch, so backfills do not retry it right away
+        self.failed: Dict[str, float] = {}
+
+    def _year(self, year: int) -> Dict[str, array.array]:
+        if year not in self.years:
+            columns = {field: array.array("f", [MISSING]) * DAYS_PER_YEAR for field in NUMERIC_FIELDS}
+            columns["condition"] = array.array("H", [0]) * DAYS_PER_YEAR
+            self.years[year] = columns
+        return self.years[year]
+
+    def record(self, day: date, values: Dict) -> None:
+        columns = self._year(day.year)
+        slot = day_slot(day)
+        for field in NUMERIC_FIELDS:
+            value = values.get(field)
+            columns[field][slot] = MISSING if value is None else float(value)
+
+        condition = values.get("condition") or ""
+        if condition and condition != "No data":
+            if condition not in self.conditions:
+                self.conditions.append(condition)
+            columns["condition"][slot] = self.conditions.index(condition)
+        self.failed.pop(day.isoformat(), None)
+
+    def mark_failed(self, day: date) -> None:
+        self.failed[day.isoformat()] = time.time()
+
+    def has_day(self, day: date) -> bool:
+        columns = self.years.get(day.year)
+        return columns is not None and not math.isnan(columns["avg_temp_c"][day_slot(day)])
+
+    def get_day(self, day: date) -> Optional[Dict]:
+        if not self.has_day(day):
+            return None
+        columns = self.years[day.year]
+        slot = day_slot(day)
+        values = {
+            field: None if math.isnan(columns[field][slot]) else round(columns[field][slot], 1)
+            for field in NUMERIC_FIELDS
+        }
+        values["condition"] = self.conditions[columns["condition"][slot]] or "No data"
+        return values
+
+    def missing_days(self, start: date, end: date, retry_after: float = 0) -> List[date]:
+        """Days without data, leaving out the ones whose fetch failed less than `retry_after` seconds ago"""
+        cutoff = time.time() - retry_after
+        missing = []
+        current = start
+        while current <= end:
+            if not self.has_day(current) and self.failed.get(current.isoformat(), 0) <= cutoff:
+                missing.append(current)
+            current += timedelta(days=1)
+        return missing
+
+    def average(self, slot: int) -> Optional[Dict]:
+        """Average one calendar day over every stored year, or None when no year has it"""
+        samples = {field: [] for field in NUMERIC_FIELDS}
+        conditions = Counter()
+        for columns in self.years.values():
+            if math.isnan(columns["avg_temp_c"][slot]):
+                continue
+            for field in NUMERIC_FIELDS:
+                value = columns[field][slot]
+                if not math.isnan(value):
+                    samples[field].append(value)
+            if columns["condition"][slot]:
+                conditions[self.conditions[columns["condition"][slot]]] += 1
+
+        if not samples["avg_temp_c"]:
+            if slot == FEB_29:
+                return self.average(FEB_29 - 1)
+            return None
+
+        result = {
+            field: round(sum(values) / len(values), 1) if values else None
+            for field, values in samples.items()
+        }
+        result["condition"] = conditions.most_common(1)[0][0] if conditions else "No data"
+        result["years_sampled"] = len(samples["avg_temp_c"])
+        return result
+
+    def to_json(self) -> Dict:
+        return {
+            "city": self.city,
+            "conditions": self.conditions,
+            "failed": self.failed,
+            "years": {
+                str(year): {field: _encode(column) for field, column in columns.items()}
+                for year, columns in self.years.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, payload: Dict) -> "CityClimatology":
+        record = cls(payload["city"])
+        record.conditions = payload.get("conditions", [""])
+        record.failed = payload.get("failed", {})
+        for year, columns in payload.get("years", {}).items():
+            record.years[int(year)] = {
+                field: _decode("H" if field == "condition" else "f", encoded)
+                for field, encoded in columns.items()
+            }
+        return record
+
+
+class ClimatologyStore:
+    def __init__(self, directory: str = "climatology_data"):
+        self.directory = directory
+        self.cities: Dict[str, CityClimatology] = {}
+
+    def _path(self, key: str) -> str:
+        slug = re.sub(r"[^a-z0-9]+", "-", key).strip("-") or "unknown"
+        return os.path.join(self.directory, f"{slug}.json")
+
+    def get(self, city: str) -> CityClimatology:
+        """Return the record for a city, loading it from disk the first time it is needed"""
+        key = normalize_city(city)
+        if key not in self.cities:
+            path = self._path(key)
+            record = None
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as f:
+                        record = CityClimatology.from_json(json.load(f))
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    record = None
+            self.cities[key] = record or CityClimatology(key)
+        return self.cities[key]
+
+    def save(self, city: str) -> None:
+        """Persist a city's record atomically so a crash mid-write never leaves a torn file"""
+        key = normalize_city(city)
+        if key not in self.cities:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cities[key].to_json(), f)
+        os.replace(tmp_path, path)
+
+    def lookup(self, city: str, start: date, end: date) -> Optional[Dict[str, Dict]]:
+        """
+        Multi-year averages for every day of a (future) date range, keyed by ISO date.
+        Returns None unless every day is covered, so callers never serve a partial timeline.
+        """
+        record = self.get(city)
+        if not record.years:
+            return None
+
+        results = {}
+        current = start
+        while current <= end:
+            averaged = record.average(day_slot(current))
+            if averaged is None:
+                return None
+            results[current.strftime("%Y-%m-%d")] = averaged
+            current += timedelta(days=1)
+        return results
+
+
+# Create a global instance
+climatology_store = ClimatologyStore(settings.CLIMATOLOGY_DIR)
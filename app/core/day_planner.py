@@ -0,0 +1,193 @@
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.core.spatial_index import haversine_km
+
+PLACE_FIELDS = ("name", "address", "category", "latitude", "longitude", "photo_url")
+
+
+def distance_matrix(points: List[Dict]) -> List[List[float]]:
+    """Pairwise haversine distances in km, computed once per plan and shared by every day's routing"""
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            distance = haversine_km(points[i]["latitude"], points[i]["longitude"],
+                                    points[j]["latitude"], points[j]["longitude"])
+            matrix[i][j] = matrix[j][i] = distance
+    return matrix
+
+
+def cluster_into_days(points: List[Dict], days: int, iterations: int = 10) -> List[List[int]]:
+    """
+    Group point indices into at most `days` geographic clusters of balanced size
+    (capacity-constrained k-means with farthest-point seeding, deterministic).
+    """
+    if not points or days <= 0:
+        return []
+    k = min(days, len(points))
+    capacity = math.ceil(len(points) / k)
+
+    # Farthest-point seeding spreads the initial centres across the city
+    seeds = [0]
+    while len(seeds) < k:
+        farthest = max(
+            range(len(points)),
+            key=lambda i: min(haversine_km(points[i]["latitude"], points[i]["longitude"],
+                                           points[s]["latitude"], points[s]["longitude"]) for s in seeds),
+        )
+        seeds.append(farthest)
+    centres = [(points[s]["latitude"], points[s]["longitude"]) for s in seeds]
+
+    clusters: List[List[int]] = []
+    for _ in range(iterations):
+        # Greedy assignment over all (distance, point, cluster) pairs respecting the capacity
+        pairs = sorted(
+            (haversine_km(p["latitude"], p["longitude"], c[0], c[1]), i, j)
+            for i, p in enumerate(points)
+            for j, c in enumerate(centres)
+        )
+        assignment: Dict[int, int] = {}
+        new_clusters: List[List[int]] = [[] for _ in centres]
+        for _, i, j in pairs:
+            if i in assignment or len(new_clusters[j]) >= capacity:
+                continue
+            assignment[i] = j
+            new_clusters[j].append(i)
+
+        if new_clusters == clusters:
+            break
+        clusters = new_clusters
+        centres = [
+            (sum(points[i]["latitude"] for i in members) / len(members),
+             sum(points[i]["longitude"] for i in members) / len(members)) if members else centres[j]
+            for j, members in enumerate(clusters)
+        ]
+    return [members for members in clusters if members]
+
+
+def route_length(route: List[int], matrix: List[List[float]], closed: bool) -> float:
+    total = sum((matrix[route[i]][route[i + 1]] for i in range(len(route) - 1)), 0.0)
+    if closed and len(route) > 1:
+        total += matrix[route[-1]][route[0]]
+    return total
+
+
+def nearest_neighbour(start: int, stops: List[int], matrix: List[List[float]]) -> List[int]:
+    route = [start]
+    remaining = [stop for stop in stops if stop != start]
+    while remaining:
+        last = route[-1]
+        nearest = min(remaining, key=lambda stop: matrix[last][stop])
+        route.append(nearest)
+        remaining.remove(nearest)
+    return route
+
+
+def two_opt(route: List[int], matrix: List[List[float]], closed: bool) -> List[int]:
+    """Reverse segments while that shortens the route; the first stop (the day's start) stays fixed"""
+    best = route[:]
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(best) - 1):
+            for j in range(i + 1, len(best)):
+                after = best[j + 1] if j + 1 < len(best) else (best[0] if closed else None)
+                current = matrix[best[i - 1]][best[i]] + (matrix[best[j]][after] if after is not None else 0)
+                candidate = matrix[best[i - 1]][best[j]] + (matrix[best[i]][after] if after is not None else 0)
+                if candidate < current - 1e-9:
+                    best[i:j + 1] = reversed(best[i:j + 1])
+                    improved = True
+    return best
+
+
+def _summary(place: Optional[Dict]) -> Optional[Dict]:
+    if place is None:
+        return None
+    return {field: place.get(field) for field in PLACE_FIELDS}
+
+
+def _nearest(places: List[Dict], anchor: Dict, used: set) -> Optional[Dict]:
+    """Nearest place to an anchor, preferring ones not used yet"""
+    if not places:
+        return None
+    candidates = [place for place in places if id(place) not in used] or places
+    choice = min(candidates, key=lambda place: haversine_km(anchor["latitude"], anchor["longitude"],
+                                                            place["latitude"], place["longitude"]))
+    used.add(id(choice))
+    return choice
+
+
+def trip_dates(start_date: str, end_date: str) -> List[str]:
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    return [(start + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range((end - start).days + 1)]
+
+
+def plan_days(trip_data: Dict, places_by_category: Dict[str, List[Dict]]) -> Dict:
+    """
+    Build a day-by-day plan: attractions are clustered into one area per day, each day is routed
+    from the hotel with nearest-neighbour + 2-opt, and lunch/dinner are the closest restaurants.
+    """
+    dates = trip_dates(trip_data["start_date"], trip_data["end_date"])
+    attractions = places_by_category.get("attractions", [])
+    restaurants = places_by_category.get("restaurants", [])
+    hotels = places_by_category.get("hotels", [])
+
+    hotel = None
+    if hotels and attractions:
+        centre = {
+            "latitude": sum(place["latitude"] for place in attractions) / len(attractions),
+            "longitude": sum(place["longitude"] for place in attractions) / len(attractions),
+        }
+        hotel = _nearest(hotels, centre, set())
+    elif hotels:
+        hotel = hotels[0]
+
+    # Index 0 is the hotel when we have one, so every day can start (and end) there
+    points = ([hotel] if hotel else []) + attractions
+    offset = 1 if hotel else 0
+    matrix = distance_matrix(points)
+    clusters = cluster_into_days(attractions, len(dates))
+    # Visit the areas closest to the hotel first
+    if hotel:
+        clusters.sort(key=lambda members: min(matrix[0][i + offset] for i in members))
+
+    used_restaurants: set = set()
+    days = []
+    for index, date in enumerate(dates):
+        members = [i + offset for i in clusters[index]] if index < len(clusters) else []
+        if not members:
+            days.append({"day": index + 1, "date": date, "stops": [], "lunch": None, "dinner": None, "distance_km": 0.0})
+            continue
+
+        if hotel:
+            route = two_opt(nearest_neighbour(0, [0] + members, matrix), matrix, closed=True)
+            stops = route[1:]
+            distance = route_length(route, matrix, closed=True)
+        else:
+            # An open path is shortest when it starts at one edge of the area
+            start = max(members, key=lambda i: sum(matrix[i][j] for j in members))
+            route = two_opt(nearest_neighbour(start, members, matrix), matrix, closed=False)
+            stops = route
+            distance = route_length(route, matrix, closed=False)
+
+        stop_places = [points[i] for i in stops]
+        lunch = _nearest(restaurants, stop_places[len(stop_places) // 2], used_restaurants)
+        dinner = _nearest(restaurants, stop_places[-1], used_restaurants)
+        days.append({
+            "day": index + 1,
+            "date": date,
+            "stops": [_summary(place) for place in stop_places],
+            "lunch": _summary(lunch),
+            "dinner": _summary(dinner),
+            "distance_km": round(distance, 2),
+        })
+
+    return {
+        "origin": trip_data.get("origin"),
+        "destination": trip_data.get("destination"),
+        "hotel": _summary(hotel),
+        "days": days,
+    }
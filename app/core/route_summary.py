@@ -12,5 +12,5 @@ async def get_route_summary(source: str, destination: str) -> str:
         source=source,
         destination=destination
     )
-    response = model.generate_content(final_prompt)
+    response = await model.generate_content_async(final_prompt)
     return response.text.strip()
@@ -0,0 +1,57 @@
+import asyncio
+
+from app.agents.weather_agent import get_weather
+from app.agents.flight_agent import get_flight_offers
+from app.agents.places_service import get_places_for_city
+
+REQUIRED_FIELDS = ["origin", "destination", "start_date", "end_date"]
+
+
+def missing_fields(trip_data: dict) -> list:
+    return [field for field in REQUIRED_FIELDS if not trip_data.get(field)]
+
+
+async def weather_section(trip_data: dict) -> dict:
+    # Get weather for both origin and destination, concurrently
+    origin_weather, dest_weather = await asyncio.gather(
+        get_weather(trip_data["origin"], trip_data["start_date"], trip_data["end_date"]),
+        get_weather(trip_data["destination"], trip_data["start_date"], trip_data["end_date"])
+    )
+
+    return weather_payload(trip_data, origin_weather, dest_weather)
+
+
+def weather_payload(trip_data: dict, origin_weather: dict, dest_weather: dict) -> dict:
+    return {
+        "origin_weather": origin_weather,
+        "destination_weather": dest_weather,
+        "trip_dates": {
+            "start": trip_data["start_date"],
+            "end": trip_data["end_date"]
+        }
+    }
+
+
+async def flights_section(trip_data: dict) -> dict:
+    return await get_flight_offers(
+        origin=trip_data["origin"],
+        destination=trip_data["destination"],
+        departure_date=trip_data["start_date"],
+        return_date=trip_data["end_date"]
+    )
+
+
+async def places_section(trip_data: dict) -> dict:
+    return places_payload(trip_data, await get_places_for_city(trip_data["destination"]))
+
+
+def places_payload(trip_data: dict, results: dict) -> dict:
+    return {"city": trip_data["destination"], **results}
+
+
+# Every section a finished trip can be enriched with
+SECTIONS = {
+    "weather": weather_section,
+    "flights": flights_section,
+    "places": places_section,
+}
@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from app.config import settings
+
+# Largest request/reply line; the biggest values cached are one tile's places, a few hundred KiB at most
+MAX_LINE_BYTES = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """
+    In-process TTL cache. Used directly when no shared daemon is configured, and as the
+    storage engine inside the daemon. Values must be JSON-serializable and treated as immutable.
+    """
+
+    available = True
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically add to an integer counter (missing counters start at 0) and return the new value"""
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            value = (entry[0] if entry else 0) + amount
+            self._data[key] = (value, entry[1] if entry else None)
+            return value
+
+    def sweep(self) -> int:
+        """Drop expired entries, returns how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires) in self._data.items() if expires is not None and expires <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def stats(self) -> Dict:
+        return {"keys": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    # Same interface as SocketCache for callers on the event loop; nothing here can block
+
+    async def aget(self, key: str) -> Any:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+    async def aincr(self, key: str, amount: int = 1) -> int:
+        return self.incr(key, amount)
+
+
+class SocketCache:
+    """
+    Client for the local cache daemon, speaking newline-delimited JSON over a Unix socket.
+    Every operation is executed atomically by the daemon's single event loop.
+
+    Code on the event loop uses the a* methods (asyncio streams); the plain methods use a blocking
+    socket and are for threads and scripts. If the daemon is unreachable the cache is marked
+    unavailable for `retry_interval` seconds and degrades to misses without trying the socket.
+    """
+
+    def __init__(self, path: str, timeout: float = 0.5, retry_interval: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._down_until = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._stream_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, error: Exception) -> None:
+        if self.available:
+            logger.warning("Shared cache at %s unavailable, retrying in %.0fs: %r", self.path, self.retry_interval, error)
+        self._down_until = time.monotonic() + self.retry_interval
+
+    def _mark_up(self) -> None:
+        if self._down_until:
+            logger.info("Shared cache at %s reachable again", self.path)
+            self._down_until = 0.0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+        return conn
+
+    def _reset(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def _encode(self, request: Dict) -> Optional[bytes]:
+        payload = orjson.dumps(request) + b"\n"
+        if len(payload) > MAX_LINE_BYTES:
+            # The daemon would drop the connection; skip caching this value rather than the whole cache
+            logger.warning("Not sending %d byte %s for %r to the shared cache", len(payload), request["op"], request.get("key"))
+            return None
+        return payload
+
+    def _call(self, request: Dict) -> Any:
+        if not self.available:
+            return None
+        payload = self._encode(request)
+        if payload is None:
+            return None
+        for attempt in range(2):
+            # Only a connection kept from an earlier call is worth retrying (the daemon may have restarted)
+            reused = getattr(self._local, "conn", None) is not None
+            try:
+                sock, reader = self._connection()
+                sock.sendall(payload)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("cache daemon closed the connection")
+                self._mark_up()
+                return orjson.loads(line).get("value")
+            except (OSError, ValueError) as e:
+                self._reset()
+                if attempt or not reused:
+                    self._mark_down(e)
+                    return None
+        return None
+
+    async def _astream(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._stream is None:
+            self._stream = await asyncio.open_unix_connection(self.path, limit=MAX_LINE_BYTES)
+        return self._stream
+
+    def _areset(self) -> None:
+        if self._stream is not None:
+            self._stream[1].close()
+        self._stream = None
+
+    async def _acall(self, request: Dict) -> Any:
+        if not self.available:
+            return None
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Streams and locks belong to the loop that created them
+            self._loop, self._stream, self._stream_lock = loop, None, asyncio.Lock()
+        payload = self._encode(request)
+        if payload is None:
+            return None
+        # One request/response at a time on the shared connection; the daemon answers in microseconds
+        async with self._stream_lock:
+            for attempt in range(2):
+                reused = self._stream is not None
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        reader, writer = await self._astream()
+                        writer.write(payload)
+                        await writer.drain()
+                        line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("cache daemon closed the connection")
+                    self._mark_up()
+                    return orjson.loads(line).get("value")
+                except (OSError, ValueError, TimeoutError) as e:
+                    self._areset()
+                    if attempt or not reused:
+                        self._mark_down(e)
+                        return None
+        return None
+
+    def get(self, key: str) -> Any:
+        return self._call({"op": "get", "key": key})
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._call({"op": "set", "key": key, "value": value, "ttl": ttl})
+
+    def delete(self, key: str) -> None:
+        self._call({"op": "delete", "key": key})
+
+    def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        return self._call({"op": "incr", "key": key, "amount": amount})
+
+    def stats(self) -> Dict:
+        return self._call({"op": "stats"}) or {}
+
+    async def aget(self, key: str) -> Any:
+        return await self._acall({"op": "get", "key": key})
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._acall({"op": "set", "key": key, "value": value, "ttl": ttl})
+
+    async def adelete(self, key: str) -> None:
+        await self._acall({"op": "delete", "key": key})
+
+    async def aincr(self, key: str, amount: int = 1) -> Optional[int]:
+        return await self._acall({"op": "incr", "key": key, "amount": amount})
+
+
+class CacheDaemon:
+    def __init__(self, path: str, sweep_interval: float = 30.0):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.cache = LocalCache()
+
+    def handle(self, request: Dict) -> Any:
+        op = request.get("op")
+        if op == "get":
+            return self.cache.get(request["key"])
+        if op == "set":
+            self.cache.set(request["key"], request.get("value"), request.get("ttl"))
+            return True
+        if op == "delete":
+            self.cache.delete(request["key"])
+            return True
+        if op == "incr":
+            return self.cache.incr(request["key"], request.get("amount", 1))
+        if op == "stats":
+            return self.cache.stats()
+        raise ValueError(f"Unknown operation: {op}")
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    reply = {"value": self.handle(orjson.loads(line))}
+                except (ValueError, KeyError) as e:
+                    reply = {"value": None, "error": str(e)}
+                writer.write(orjson.dumps(reply) + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.cache.sweep()
+
+    async def serve(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._serve_client, path=self.path, limit=MAX_LINE_BYTES)
+        sweeper = asyncio.create_task(self._sweep_forever())
+        print(f"Shared cache daemon listening on {self.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+
+def get_cache_backend():
+    """Use the shared daemon when SHARED_CACHE_SOCKET is set, otherwise a per-process cache"""
+    if settings.SHARED_CACHE_SOCKET:
+        return SocketCache(settings.SHARED_CACHE_SOCKET)
+    return LocalCache()
+
+
+# Create a global instance
+cache_backend = get_cache_backend()
+
+if __name__ == "__main__":
+    # python -m app.core.shared_cache  (start before `uvicorn --workers N`, with the same SHARED_CACHE_SOCKET)
+    asyncio.run(CacheDaemon(settings.SHARED_CACHE_SOCKET or "/tmp/travel_agent_cache.sock").serve())
@@ -0,0 +1,83 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class SpatialIndex:
+    """
+    Uniform grid over latitude/longitude. Each cell holds the places whose coordinates fall in it,
+    so radius and bounding-box queries only scan the handful of cells they overlap.
+    """
+
+    def __init__(self, cell_degrees: float = 0.01):
+        self.cell_degrees = cell_degrees
+        self.cells: Dict[Tuple[int, int], Dict[str, Dict]] = {}
+        self.locations: Dict[str, Tuple[int, int]] = {}
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def add(self, place_id: str, place: Dict) -> None:
+        lat, lng = place.get("latitude"), place.get("longitude")
+        if lat is None or lng is None:
+            return
+        cell = self._cell(lat, lng)
+        previous = self.locations.get(place_id)
+        if previous is not None and previous != cell:
+            self.cells[previous].pop(place_id, None)
+        self.cells.setdefault(cell, {})[place_id] = place
+        self.locations[place_id] = cell
+
+    def add_many(self, places: Iterable[Dict]) -> None:
+        for place in places:
+            place_id = place.get("fsq_id") or f"{place.get('name')}@{place.get('latitude')},{place.get('longitude')}"
+            self.add(place_id, place)
+
+    def _scan(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        low_row, low_col = self._cell(min_lat, min_lng)
+        high_row, high_col = self._cell(max_lat, max_lng)
+        if high_row < low_row or high_col < low_col:
+            return
+        # A large box covers more cells than are occupied; then walking the occupied ones is cheaper
+        if (high_row - low_row + 1) * (high_col - low_col + 1) > len(self.cells):
+            for (row, col), places in self.cells.items():
+                if low_row <= row <= high_row and low_col <= col <= high_col:
+                    yield from places.values()
+            return
+        for row in range(low_row, high_row + 1):
+            for col in range(low_col, high_col + 1):
+                yield from self.cells.get((row, col), {}).values()
+
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                    category: Optional[str] = None) -> List[Dict]:
+        return [
+            place for place in self._scan(min_lat, min_lng, max_lat, max_lng)
+            if min_lat <= place["latitude"] <= max_lat
+            and min_lng <= place["longitude"] <= max_lng
+            and (category is None or place.get("category") == category)
+        ]
+
+    def within_radius(self, lat: float, lng: float, radius_km: float,
+                      category: Optional[str] = None) -> List[Dict]:
+        """Places within radius_km of a point, nearest first, each annotated with distance_km"""
+        lat_delta = radius_km / 111.0
+        lng_delta = radius_km / max(111.0 * math.cos(math.radians(lat)), 1e-6)
+        matches = []
+        for place in self._scan(lat - lat_delta, lng - lng_delta, lat + lat_delta, lng + lng_delta):
+            if category is not None and place.get("category") != category:
+                continue
+            distance = haversine_km(lat, lng, place["latitude"], place["longitude"])
+            if distance <= radius_km:
+                matches.append({**place, "distance_km": round(distance, 3)})
+        matches.sort(key=lambda place: place["distance_km"])
+        return matches
@@ -1,14 +1,61 @@
+import asyncio
+import copy
+import fcntl
 import json
+import logging
 import uuid
 import os
-from typing import Dict, Optional
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
+from app.config import settings
+from app.core.shared_cache import cache_backend
+
+VERSION_KEY = "trips:version"
+# Longest wait between retries of a flush that keeps failing
+MAX_RETRY_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class ChangesExpired(Exception):
+    """The requested cursor is older than the retained change log"""
 
 class TripStorage:
-    def __init__(self, storage_file: str = "trip_data.json"):
+    """
+    Trips live in memory and in `storage_file`; every mutation is also an event in the append-only
+    `changes_file`. The log is shared by all workers: sequence numbers are handed out while holding an
+    exclusive file lock on it, so the order of lines in the file is the sequence order, and workers
+    catch up on each other's writes by replaying the part of the log they have not read yet.
+    """
+
+    def __init__(self, storage_file: str = "trip_data.json", cache=None, flush_delay: float = 0.005,
+                 changes_file: str = "trip_changes.jsonl", changes_retain: int = 10000):
         self.storage_file = storage_file
+        self.cache = cache
+        self.flush_delay = flush_delay
+        self.changes_file = changes_file
+        self.changes_retain = changes_retain
         self.trip_data = {}
+        self.version = cache.get(VERSION_KEY) if cache is not None else None
+        self._write_lock = asyncio.Lock()
+        self._pending: List[asyncio.Future] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_failures = 0
+        # Held for a whole flush (and for every log read) so two never touch the files at the same time
+        self._flush_lock = asyncio.Lock()
+        # Change feed: `changes` holds the retained tail of durable events, `_staged` the ones
+        # applied in memory but not flushed yet. `seq` is the last sequence number we have read or written.
+        self.changes: deque = deque(maxlen=changes_retain)
+        self.seq = 0
+        self._staged: List[Dict] = []
+        self._log_inode: Optional[int] = None
+        self._log_offset = 0
+        self._log_lines = 0
+        self._changed = asyncio.Event()
         self._load_data()
+        self._load_changes()
 
     def _load_data(self) -> None:
         """Load trip data from the storage file"""
@@ -21,48 +68,357 @@ class TripStorage:
         else:
             self.trip_data = {}
 
-    def _save_data(self) -> None:
-        """Save trip data to the storage file"""
-        with open(self.storage_file, 'w') as f:
-            json.dump(self.trip_data, f, indent=2)
+    def _load_changes(self) -> None:
+        """Replay the retained change log on top of the storage file, which may lag it after a crash"""
+        events = self._read_log()
+        self._apply(self.trip_data, events)
+        self._publish_changes(events)
+
+    @staticmethod
+    def _apply(trips: Dict, events: Iterable[Dict], skip: Iterable[str] = ()) -> None:
+        """Apply change events (which carry the whole record) to a trips dict"""
+        skip = set(skip)
+        for event in events:
+            if event["trip_id"] in skip:
+                continue
+            if event["op"] == "delete":
+                trips.pop(event["trip_id"], None)
+            else:
+                trips[event["trip_id"]] = copy.deepcopy(event["trip"])
+
+    def _read_log(self) -> List[Dict]:
+        """
+        Events in the change log after the ones we have already read. Only complete lines are consumed,
+        so it is safe to call while another worker is appending. Callers must hold _flush_lock.
+        """
+        try:
+            stat = os.stat(self.changes_file)
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            # First read, or another worker compacted the log: start over and skip what we have seen
+            self._log_inode, self._log_offset, self._log_lines = stat.st_ino, 0, 0
+        if stat.st_size == self._log_offset:
+            return []
+
+        with open(self.changes_file, 'rb') as f:
+            f.seek(self._log_offset)
+            chunk = f.read()
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        self._log_offset += len(complete)
+
+        events = []
+        for line in complete.splitlines():
+            self._log_lines += 1
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn line from a crash mid-append
+                continue
+            if event["seq"] > self.seq:
+                events.append(event)
+        return events
+
+    @contextmanager
+    def _log_locked(self):
+        """Exclusive lock on the change log, shared by every worker process"""
+        with open(f"{self.changes_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_changes(self, events: List[Dict]) -> None:
+        """Durably append events to the change log. Caller holds the log lock and has read the log to its end."""
+        if not events:
+            return
+        lines = "".join(json.dumps(event) + "\n" for event in events).encode()
+        with open(self.changes_file, 'ab') as f:
+            if f.tell() != self._log_offset:
+                # Terminate a torn line left by a crash so our first event stays readable
+                lines = b"\n" + lines
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_offset = f.tell()
+        self._log_inode = os.stat(self.changes_file).st_ino
+        self._log_lines += len(events)
+
+    def _compact_log(self) -> None:
+        """Keep only the retained tail. Works from the file itself, never from our in-memory view of it."""
+        with open(self.changes_file, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        retained = lines[-self.changes_retain:]
+        tmp_path = f"{self.changes_file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.writelines(retained)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.changes_file)
+        stat = os.stat(self.changes_file)
+        self._log_inode, self._log_offset, self._log_lines = stat.st_ino, stat.st_size, len(retained)
+
+    def _persist(self, payload: str, events: List[Dict]) -> List[Dict]:
+        """
+        Runs in a worker thread under _flush_lock. Picks up other workers' events, numbers ours after them,
+        appends them and rewrites the storage file, all under the log lock. Returns the other workers' events.
+        """
+        with self._log_locked():
+            foreign = self._read_log()
+            last = foreign[-1]["seq"] if foreign else self.seq
+            for offset, event in enumerate(events, start=1):
+                event["seq"] = last + offset
+            if foreign:
+                # Our own trips keep our newer version, everything else follows the log
+                trips = json.loads(payload)
+                self._apply(trips, foreign, skip=(event["trip_id"] for event in events))
+                payload = json.dumps(trips, indent=2)
+            # The log goes first so a durable trip state is never missing from the feed
+            self._append_changes(events)
+            if self._log_lines > 2 * self.changes_retain:
+                self._compact_log()
+            self._write_file(payload)
+        return foreign
+
+    def _stage(self, op: str, trip_id: str) -> None:
+        """Record a change event for a mutation that was just applied in memory; it is numbered at flush time"""
+        record = self.trip_data.get(trip_id)
+        self._staged.append({
+            "op": op,
+            "trip_id": trip_id,
+            "at": datetime.now().isoformat(),
+            "trip": copy.deepcopy(record) if record is not None else None
+        })
+
+    def _publish_changes(self, events: List[Dict]) -> None:
+        """Expose durable events to feed readers and wake up long-polls"""
+        if not events:
+            return
+        self.changes.extend(events)
+        self.seq = max(self.seq, events[-1]["seq"])
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _write_file(self, payload: str) -> None:
+        """Durably replace the storage file; readers never see a half-written file"""
+        tmp_path = f"{self.storage_file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.storage_file)
+
+    async def _publish(self) -> None:
+        """Tell other workers there is something new in the log"""
+        if self.cache is None:
+            return
+        previous = self.version
+        version = await self.cache.aincr(VERSION_KEY)
+        # Only skip our own bump; if another worker bumped in between, the next read catches up
+        if previous is not None and version is not None and version == previous + 1:
+            self.version = version
+
+    def _apply_foreign(self, events: List[Dict], own: Iterable[Dict] = ()) -> None:
+        # Trips with writes of ours that are newer in the log, or still waiting for their flush, keep the in-memory version
+        skip = [event["trip_id"] for event in self._staged] + [event["trip_id"] for event in own]
+        self._apply(self.trip_data, events, skip=skip)
+        self._publish_changes(events)
+
+    async def _catch_up(self) -> None:
+        """Read other workers' new log entries; caller holds _flush_lock"""
+        self._apply_foreign(await asyncio.to_thread(self._read_log))
 
-    def create_trip(self, data: Dict) -> str:
-        """Create a new trip entry and return its UUID"""
-        trip_id = str(uuid.uuid4())
+    async def _refresh(self) -> None:
+        """Pick up writes made by other workers since our last read"""
+        if self.cache is None:
+            return
+        version = await self.cache.aget(VERSION_KEY)
+        # Without the cache we cannot tell whether other workers wrote, so fall back to checking the log itself
+        available = self.cache.available
+        if (available and version == self.version) or self._flush_lock.locked():
+            # Nothing new, or a flush is running and will read the log anyway
+            return
+        async with self._flush_lock:
+            if available:
+                self.version = version
+            await self._catch_up()
+
+    def _insert(self, trip_id: str, data: Dict) -> None:
+        now = datetime.now().isoformat()
         self.trip_data[trip_id] = {
-            "data": data,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "data": dict(data),
+            "created_at": now,
+            "updated_at": now
         }
-        self._save_data()
-        return trip_id
 
-    def update_trip(self, trip_id: str, data: Dict) -> bool:
-        """Update an existing trip entry"""
-        if trip_id not in self.trip_data:
-            return False
-        
+    def _update(self, trip_id: str, data: Dict) -> None:
         self.trip_data[trip_id]["data"].update(data)
         self.trip_data[trip_id]["updated_at"] = datetime.now().isoformat()
-        self._save_data()
-        return True
 
-    def get_trip(self, trip_id: str) -> Optional[Dict]:
-        """Get trip data by UUID"""
+    # Every read and write goes through this async API. Writes are serialized by a lock and
+    # group-committed: every write landing within flush_delay of the first one shares a single durable flush.
+    # Lock order is always _flush_lock before _write_lock.
+
+    async def _commit(self) -> None:
+        """Wait until the current in-memory state has been flushed to disk"""
+        done = asyncio.get_running_loop().create_future()
+        self._pending.append(done)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        await done
+
+    def _take_batch(self) -> Tuple[List[asyncio.Future], List[Dict], str]:
+        """Detach everything staged so far; caller holds _write_lock"""
+        batch, self._pending = self._pending, []
+        events, self._staged = self._staged, []
+        self._flush_task = None
+        # Serialize under the lock so the file gets a consistent snapshot
+        return batch, events, json.dumps(self.trip_data, indent=2)
+
+    async def _write_batch(self, batch: List[asyncio.Future], events: List[Dict], payload: str) -> None:
+        """
+        Persist a detached batch and resolve its waiters; caller holds _flush_lock. The batch is already
+        applied in memory, so if persisting fails it goes back in front of the staged writes and is retried:
+        its waiters only return once it is durable, and nothing served from memory ever skips the log.
+        """
+        try:
+            foreign = await asyncio.to_thread(self._persist, payload, events)
+        except Exception:
+            self._requeue(batch, events)
+            raise
+        self._flush_failures = 0
+        self._apply_foreign(foreign, own=events)
+        self._publish_changes(events)
+        await self._publish()
+        for done in batch:
+            if not done.done():
+                done.set_result(None)
+
+    def _requeue(self, batch: List[asyncio.Future], events: List[Dict]) -> None:
+        """Put a batch that failed to persist back in front of the queue and schedule a retry"""
+        for event in events:
+            event.pop("seq", None)
+        self._pending[:0] = batch
+        self._staged[:0] = events
+        self._flush_failures += 1
+        if self._flush_task is None:
+            delay = min(self.flush_delay * 2 ** self._flush_failures, MAX_RETRY_DELAY)
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: Optional[float] = None) -> None:
+        await asyncio.sleep(self.flush_delay if delay is None else delay)
+        # Writes staged while an earlier flush is still on disk wait here and go out as the next batch
+        async with self._flush_lock:
+            async with self._write_lock:
+                batch, events, payload = self._take_batch()
+            if batch or events:
+                try:
+                    await self._write_batch(batch, events, payload)
+                except Exception:
+                    logger.exception("Flushing %d trip changes failed, retrying", len(events))
+
+    async def aget_trip(self, trip_id: str) -> Optional[Dict]:
+        """Get trip data by UUID, served from memory"""
+        await self._refresh()
         return self.trip_data.get(trip_id)
 
-    def delete_trip(self, trip_id: str) -> bool:
-        """Delete a trip entry"""
-        if trip_id not in self.trip_data:
-            return False
-        
-        del self.trip_data[trip_id]
-        self._save_data()
+    async def aget_all_trips(self) -> Dict:
+        """Get all trip data, served from memory"""
+        await self._refresh()
+        return self.trip_data
+
+    async def acreate_trip(self, data: Dict) -> str:
+        await self._refresh()
+        async with self._write_lock:
+            trip_id = str(uuid.uuid4())
+            self._insert(trip_id, data)
+            self._stage("create", trip_id)
+        await self._commit()
+        return trip_id
+
+    async def aupdate_trip(self, trip_id: str, data: Dict) -> bool:
+        await self._refresh()
+        async with self._write_lock:
+            if trip_id not in self.trip_data:
+                return False
+            self._update(trip_id, data)
+            self._stage("update", trip_id)
+        await self._commit()
         return True
 
-    def get_all_trips(self) -> Dict:
-        """Get all trip data"""
-        return self.trip_data
+    async def aupsert_trip(self, trip_id: str, data: Dict) -> None:
+        await self._refresh()
+        async with self._write_lock:
+            if trip_id in self.trip_data:
+                self._update(trip_id, data)
+                self._stage("update", trip_id)
+            else:
+                self._insert(trip_id, data)
+                self._stage("create", trip_id)
+        await self._commit()
+
+    async def adelete_trip(self, trip_id: str) -> bool:
+        await self._refresh()
+        async with self._write_lock:
+            if trip_id not in self.trip_data:
+                return False
+            del self.trip_data[trip_id]
+            self._stage("delete", trip_id)
+        await self._commit()
+        return True
+
+    # Change feed. Events are only visible once durable, in sequence order, and a consumer
+    # resumes by passing back the last seq it processed as its cursor.
+
+    async def changes_since(self, cursor: int, limit: int = 500) -> List[Dict]:
+        """Durable events after `cursor`; raises ChangesExpired if events after it were already dropped"""
+        await self._refresh()
+        if self.changes and cursor < self.changes[0]["seq"] - 1:
+            raise ChangesExpired(f"Cursor {cursor} is older than the retained log (oldest seq {self.changes[0]['seq']})")
+        events = []
+        for event in reversed(self.changes):
+            if event["seq"] <= cursor:
+                break
+            events.append(event)
+        events.reverse()
+        return events[:limit]
+
+    async def wait_for_changes(self, cursor: int, timeout: float, limit: int = 500,
+                               poll_interval: float = 1.0) -> List[Dict]:
+        """Long-poll: return as soon as events after `cursor` exist, or [] after `timeout` seconds"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            events = await self.changes_since(cursor, limit)
+            remaining = deadline - loop.time()
+            if events or remaining <= 0:
+                return events
+            # Wake up periodically as well, writes from other workers only show up through _refresh
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(remaining, poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    async def asnapshot(self) -> Dict:
+        """Point-in-time copy of every trip plus the cursor to resume the change feed from"""
+        async with self._flush_lock:
+            async with self._write_lock:
+                # Flush staged writes first so every change in the copy is covered by the cursor
+                batch, events, payload = self._take_batch()
+                if batch or events:
+                    await self._write_batch(batch, events, payload)
+                else:
+                    await self._catch_up()
+                return {
+                    "cursor": self.seq,
+                    "taken_at": datetime.now().isoformat(),
+                    "trips": copy.deepcopy(self.trip_data)
+                }
 
 # Create a global instance
-trip_storage = TripStorage() 
\ No newline at end of file
+trip_storage = TripStorage(
+    cache=cache_backend,
+    flush_delay=settings.TRIP_FLUSH_DELAY_MS / 1000,
+    changes_retain=settings.TRIP_CHANGES_RETAIN
+)
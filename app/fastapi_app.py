@@ -1,7 +1,25 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from app.api.routes import router as api_router
+from app.api.websocket import router as websocket_router
+from app.api.compression import CompressionMiddleware
+from app.api.admission import AdmissionMiddleware, default_gates
+from app.api.profiling import ProfilingMiddleware, router as admin_router
+from app.config import settings
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Sits inside CORS so rejected requests still carry CORS headers
+app.add_middleware(AdmissionMiddleware, gates=default_gates("/api/v1"))
+if settings.PROFILE_TOKEN or settings.PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=settings.PROFILE_TOKEN,
+        sample_rate=settings.PROFILE_SAMPLE_RATE,
+        interval=settings.PROFILE_INTERVAL_MS / 1000,
+        directory=settings.PROFILE_DIR,
+        max_profiles=settings.PROFILE_MAX_FILES,
+    )
 
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -10,6 +28,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag", "Last-Modified", "Retry-After", "X-Change-Cursor"],  # Let browser clients revalidate and back off
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
 
 app.include_router(api_router, prefix="/api/v1")
+app.include_router(websocket_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/admin")
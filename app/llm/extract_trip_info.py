@@ -2,13 +2,33 @@ from fastapi import HTTPException
 import google.generativeai as genai
 from app.config import settings
 import re
-import json
-from typing import Dict, Optional
-from datetime import datetime
+from typing import Callable, Dict, Optional
+from collections import Counter
 import os
+from app.llm.trip_schema import RESPONSE_SCHEMA, parse_trip_response
 
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# Structured output: the model must answer with a JSON object matching the trip schema
+EXTRACTION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=RESPONSE_SCHEMA,
+)
+
+# Counts of model responses by outcome, exposed through /metrics/extraction
+extraction_metrics = Counter()
+
+def get_extraction_metrics() -> dict:
+    responses = extraction_metrics["responses"]
+    return {
+        "responses": responses,
+        "parsed": extraction_metrics["parsed"],
+        "repaired": extraction_metrics["repaired"],
+        "failed": extraction_metrics["failed"],
+        "failure_rate": extraction_metrics["failed"] / responses if responses else 0.0,
+        "repair_rate": extraction_metrics["repaired"] / responses if responses else 0.0,
+    }
+
 class ChatManager:
     def __init__(self):
         self.chats = {}  # trip_id -> chat session
@@ -17,7 +37,9 @@ class ChatManager:
     def get_or_create_chat(self, trip_id: str) -> tuple:
         if trip_id not in self.chats:
             # Create new chat and conversation state
-            self.chats[trip_id] = genai.GenerativeModel("gemini-2.0-flash").start_chat(history=[])
+            self.chats[trip_id] = genai.GenerativeModel(
+                "gemini-2.0-flash", generation_config=EXTRACTION_CONFIG
+            ).start_chat(history=[])
             self.conversation_states[trip_id] = {
                 "required_fields": ["origin", "destination", "start_date", "end_date"],
                 "current_data": {
@@ -63,7 +85,52 @@ prompt_file_path = os.path.join(os.path.dirname(__file__), "../prompts/initiatin
 with open(prompt_file_path, "r", encoding="utf-8") as file:
     initiating_prompt = file.read()
 
-def extract_trip_info_from_prompt(prompt: str, trip_id: Optional[str] = None) -> dict:
+class FollowUpStreamer:
+    """
+    Incrementally pulls the "follow_up" string out of a JSON response while it is still
+    being generated, so clients can show the question before the full object arrives.
+    """
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # index of the first unread character of the value
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.position is None:
+            match = re.search(r'"follow_up"\s*:\s*"', self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+
+        delta = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if char == "\\":
+                if self.position + 1 >= len(self.buffer):
+                    break  # wait for the escaped character
+                escaped = self.buffer[self.position + 1]
+                if escaped == "u":
+                    if self.position + 6 > len(self.buffer):
+                        break
+                    delta.append(chr(int(self.buffer[self.position + 2:self.position + 6], 16)))
+                    self.position += 6
+                    continue
+                delta.append(self.ESCAPES.get(escaped, escaped))
+                self.position += 2
+                continue
+            if char == '"':
+                self.done = True
+                break
+            delta.append(char)
+            self.position += 1
+        return "".join(delta)
+
+def _prepare_message(prompt: str, trip_id: Optional[str]) -> tuple:
     if not trip_id:
         trip_id = "default"  # For non-trip_id conversations
     
@@ -78,28 +145,43 @@ def extract_trip_info_from_prompt(prompt: str, trip_id: Optional[str] = None) ->
     if state["conversation_history"]:
         context += "Previous conversation:\n" + "\n".join(state["conversation_history"][-3:]) + "\n\n"
     
-    # Get response from Gemini
-    response = chat.send_message(f"{context}Current user message: {prompt}")
-    raw_text = response.text
-    
-    # Clean the response
-    raw_text = re.sub(r"^```(?:json)?\s*", "", raw_text.strip())
-    raw_text = re.sub(r"\s*```$", "", raw_text)
-    
+    return trip_id, chat, state, f"{context}Current user message: {prompt}"
+
+def _apply_response(trip_id: str, state: dict, raw_text: str) -> dict:
+    extraction_metrics["responses"] += 1
     try:
-        # Parse the response
-        response_data = json.loads(raw_text)
-        
-        # Update conversation state
-        chat_manager.update_state(trip_id, response_data)
-        
-        # Add Gemini's response to history
-        state["conversation_history"].append(f"Assistant: {response_data.get('follow_up', '')}")
-        
-        # Return current state
-        return state["current_data"]
-        
-    except json.JSONDecodeError:
+        # Parse and validate the response, repairing near-valid JSON locally instead of re-asking the model
+        trip_info, repaired = parse_trip_response(raw_text)
+    except ValueError:
+        extraction_metrics["failed"] += 1
         raise HTTPException(status_code=400, detail="Invalid response format from AI model")
+    extraction_metrics["repaired" if repaired else "parsed"] += 1
+    response_data = trip_info.model_dump()
+    
+    # Update conversation state
+    chat_manager.update_state(trip_id, response_data)
+    
+    # Add Gemini's response to history
+    state["conversation_history"].append(f"Assistant: {response_data['follow_up']}")
+    
+    # Return current state
+    return state["current_data"]
 
+def extract_trip_info_from_prompt(prompt: str, trip_id: Optional[str] = None) -> dict:
+    trip_id, chat, state, message = _prepare_message(prompt, trip_id)
+    
+    # Get response from Gemini
+    response = chat.send_message(message)
+    return _apply_response(trip_id, state, response.text)
 
+def stream_trip_info_from_prompt(prompt: str, trip_id: Optional[str], on_follow_up: Callable[[str], None]) -> dict:
+    """Same as extract_trip_info_from_prompt, calling on_follow_up with each new piece of the follow-up text"""
+    trip_id, chat, state, message = _prepare_message(prompt, trip_id)
+    streamer = FollowUpStreamer()
+    
+    response = chat.send_message(message, stream=True)
+    for chunk in response:
+        delta = streamer.feed(chunk.text)
+        if delta:
+            on_follow_up(delta)
+    return _apply_response(trip_id, state, streamer.buffer)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 import google.generativeai as genai
 from app.prompts.utils import get_prompt
 from app.config import settings
@@ -6,7 +7,22 @@ from app.config import settings
 genai.configure(api_key=settings.GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-2.0-flash")
 
-async def get_itinerary_response(trip_data) -> str:
+def format_plan(plan: dict) -> str:
+    """Compact text rendering of a computed plan, far fewer tokens than the raw JSON"""
+    lines = []
+    if plan.get("hotel"):
+        lines.append(f"Hotel: {plan['hotel']['name']} ({plan['hotel']['address']})")
+    for day in plan["days"]:
+        stops = ", ".join(stop["name"] for stop in day["stops"]) or "free day"
+        line = f"Day {day['day']} ({day['date']}): {stops}"
+        if day.get("lunch"):
+            line += f"; lunch at {day['lunch']['name']}"
+        if day.get("dinner"):
+            line += f"; dinner at {day['dinner']['name']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+async def get_itinerary_response(trip_data, plan: Optional[dict] = None) -> str:
     start_date = trip_data['start_date']
     end_date = trip_data['end_date']
     source = trip_data['origin']
@@ -14,14 +30,25 @@ async def get_itinerary_response(trip_data) -> str:
     start = datetime.strptime(start_date, "%Y-%m-%d")
     end = datetime.strptime(end_date, "%Y-%m-%d")
     
-    # Load and fill prompt
-    template = get_prompt("itinerary_prompt.txt")
-    prompt = template.format(
-        source=source,
-        destination=destination,
-        start_date=start.strftime("%B %d, %Y"),
-        end_date=end.strftime("%B %d, %Y"),
-    )
-    response = model.generate_content(f"Current user message: {prompt}")
+    # Load and fill prompt; with a computed plan the model only writes prose around it
+    if plan:
+        template = get_prompt("itinerary_narration_prompt.txt")
+        prompt = template.format(
+            source=source,
+            destination=destination,
+            start_date=start.strftime("%B %d, %Y"),
+            end_date=end.strftime("%B %d, %Y"),
+            plan=format_plan(plan),
+        )
+    else:
+        template = get_prompt("itinerary_prompt.txt")
+        prompt = template.format(
+            source=source,
+            destination=destination,
+            start_date=start.strftime("%B %d, %Y"),
+            end_date=end.strftime("%B %d, %Y"),
+        )
+    # Async client call, so a multi-second generation never blocks the event loop
+    response = await model.generate_content_async(f"Current user message: {prompt}")
     raw_text = response.text
     return raw_text.strip()  # Remove leading/trailing whitespace
\ No newline at end of file
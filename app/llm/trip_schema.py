@@ -0,0 +1,205 @@
+import json
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%m-%d-%Y", "%d.%m.%Y",
+    "%B %d, %Y", "%B %d %Y", "%b %d, %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y",
+)
+YEARLESS_FORMATS = ("%B %d", "%b %d", "%d %B", "%d %b", "%m/%d")
+
+# Schema handed to Gemini's structured output mode, mirrors TripInfo
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "origin": {"type": "string", "description": "Origin city name, empty if unknown"},
+        "destination": {"type": "string", "description": "Destination city name, empty if unknown"},
+        "start_date": {"type": "string", "description": "Trip start date as YYYY-MM-DD, empty if unknown"},
+        "end_date": {"type": "string", "description": "Trip end date as YYYY-MM-DD, empty if unknown"},
+        "follow_up": {"type": "string", "description": "Next question or confirmation for the user"},
+        "is_complete": {"type": "boolean"},
+    },
+    "required": ["origin", "destination", "start_date", "end_date", "follow_up", "is_complete"],
+}
+
+
+def normalize_date(value) -> str:
+    """Return an ISO YYYY-MM-DD date, or "" when the value cannot be read as a date"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if not isinstance(value, str) or not value.strip():
+        return ""
+
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", value.strip())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+
+    # No year given: use the next occurrence of that day
+    today = date.today()
+    for fmt in YEARLESS_FORMATS:
+        for year in range(today.year, today.year + 5):
+            try:
+                candidate = datetime.strptime(f"{text} {year}", f"{fmt} %Y").date()
+            except ValueError:
+                continue
+            if candidate >= today:
+                return candidate.isoformat()
+    return ""
+
+
+class TripInfo(BaseModel):
+    origin: str = ""
+    destination: str = ""
+    start_date: str = ""
+    end_date: str = ""
+    follow_up: str = ""
+    is_complete: bool = False
+
+    @field_validator("origin", "destination", "follow_up", mode="before")
+    @classmethod
+    def _text(cls, value) -> str:
+        return "" if value is None else str(value).strip()
+
+    @field_validator("start_date", "end_date", mode="before")
+    @classmethod
+    def _date(cls, value) -> str:
+        return normalize_date(value)
+
+    @field_validator("is_complete", mode="before")
+    @classmethod
+    def _flag(cls, value) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("true", "yes", "1")
+        return bool(value)
+
+
+def _strip_fences(text: str) -> str:
+    text = re.sub(r"^```(?:json)?\s*", "", text.strip())
+    return re.sub(r"\s*```$", "", text)
+
+
+def _split_strings(text: str) -> Tuple[List[Tuple[bool, str]], bool]:
+    """
+    Split JSON-ish text into (is_string, chunk) pieces so fixes can be limited to the parts outside
+    string values. Smart quotes count as delimiters outside strings and are normalized to '"'.
+    Returns the pieces and whether the text ends inside an unterminated string.
+    """
+    pieces: List[Tuple[bool, str]] = []
+    outside: List[str] = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char not in ('"', "\u201c", "\u201d"):
+            outside.append(char)
+            i += 1
+            continue
+        pieces.append((False, "".join(outside)))
+        outside = []
+        closers = ('"',) if char == '"' else ('"', "\u201c", "\u201d")
+        value = ['"']
+        i += 1
+        while i < len(text) and text[i] not in closers:
+            # Keep escapes intact, including an escaped quote
+            step = 2 if text[i] == "\\" else 1
+            value.append(text[i:i + step])
+            i += step
+        if i >= len(text):
+            pieces.append((True, "".join(value)))
+            return pieces, True
+        value.append('"')
+        pieces.append((True, "".join(value)))
+        i += 1
+    pieces.append((False, "".join(outside)))
+    return pieces, False
+
+
+def _fix_outside(chunk: str) -> str:
+    chunk = re.sub(r"\bTrue\b", "true", chunk)
+    chunk = re.sub(r"\bFalse\b", "false", chunk)
+    chunk = re.sub(r"\bNone\b", "null", chunk)
+    return re.sub(r",\s*([}\]])", r"\1", chunk)
+
+
+def _cut_object(pieces: List[Tuple[bool, str]]) -> Tuple[List[Tuple[bool, str]], bool]:
+    """
+    Cut the pieces right after the brace that closes the first object, dropping any prose after it.
+    Braces inside string values are ignored. Returns the pieces and whether the object was closed.
+    """
+    depth = 0
+    for index, (is_string, chunk) in enumerate(pieces):
+        if is_string:
+            continue
+        for offset, char in enumerate(chunk):
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return pieces[:index] + [(False, chunk[:offset + 1])], True
+    return pieces, False
+
+
+def repair_json(text: str) -> Optional[dict]:
+    """
+    Cheap local fixes for near-valid JSON: stray prose, smart quotes, trailing commas, Python literals,
+    truncation. Only text outside string values is rewritten, and a field cut off mid-value is dropped.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    candidate = text[start:]
+
+    if '"' not in candidate and "\u201c" not in candidate:
+        candidate = candidate.replace("\u2018", "'").replace("\u2019", "'").replace("'", '"')
+    pieces, truncated = _split_strings(candidate)
+    pieces, closed = _cut_object(pieces)
+    if truncated and not closed:
+        # The last string was cut off: drop it along with the rest of its field
+        pieces.pop()
+        while pieces and (pieces[-1][0] or not re.search(r"[,{]", pieces[-1][1])):
+            pieces.pop()
+        if pieces:
+            chunk = pieces[-1][1]
+            cut = max(chunk.rfind(","), chunk.rfind("{"))
+            pieces[-1] = (False, chunk[:cut] if chunk[cut] == "," else chunk[:cut + 1])
+    pieces = [(is_string, chunk if is_string else _fix_outside(chunk)) for is_string, chunk in pieces]
+
+    # Close a response that was cut off mid-object
+    if pieces and not pieces[-1][0]:
+        pieces[-1] = (False, re.sub(r",\s*$", "", pieces[-1][1]))
+    depth = sum(chunk.count("{") - chunk.count("}") for is_string, chunk in pieces if not is_string)
+    candidate = "".join(chunk for _, chunk in pieces) + "}" * max(depth, 0)
+
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_trip_response(raw_text: str) -> Tuple[TripInfo, bool]:
+    """
+    Parse a model response into a TripInfo. Returns (trip, repaired) and raises ValueError
+    when the text cannot be recovered locally.
+    """
+    text = _strip_fences(raw_text)
+    repaired = False
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = repair_json(text)
+        repaired = True
+    if not isinstance(data, dict):
+        raise ValueError("Response is not a JSON object")
+    try:
+        return TripInfo.model_validate(data), repaired
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
@@ -0,0 +1,97 @@
+"""
+Compare per-process caches with the shared cache daemon under a multi-worker workload.
+
+    python -m benchmarks.shared_cache_bench --workers 4 --requests 2000
+
+Each worker draws keys from a skewed (Zipf-like) distribution, as popular destinations are,
+and pays a simulated upstream delay on every miss. Reports hit rate, cache operation
+latency and total time per request for both setups.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.core.shared_cache import CacheDaemon, LocalCache, SocketCache
+
+
+def run_daemon(path: str) -> None:
+    asyncio.run(CacheDaemon(path).serve())
+
+
+def run_worker(seed: int, socket_path: str, args, results) -> None:
+    cache = SocketCache(socket_path) if socket_path else LocalCache()
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(args.keys)]
+    keys = rng.choices(range(args.keys), weights=weights, k=args.requests)
+
+    hits = 0
+    op_latencies = []
+    request_latencies = []
+    for key in keys:
+        started = time.perf_counter()
+        value = cache.get(f"bench:{key}")
+        op_latencies.append(time.perf_counter() - started)
+        if value is None:
+            time.sleep(args.upstream_ms / 1000)  # Simulated upstream call
+            cache.set(f"bench:{key}", {"key": key, "payload": "x" * args.value_bytes}, ttl=300)
+        else:
+            hits += 1
+        request_latencies.append(time.perf_counter() - started)
+    results.put((hits, op_latencies, request_latencies))
+
+
+def run_scenario(name: str, socket_path: str, args) -> None:
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(seed, socket_path, args, results))
+        for seed in range(args.workers)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    collected = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    hits = sum(item[0] for item in collected)
+    ops = sorted(latency for item in collected for latency in item[1])
+    requests = [latency for item in collected for latency in item[2]]
+    total = args.workers * args.requests
+    print(
+        f"{name:<12} hit rate {hits / total:6.1%}  "
+        f"cache op mean {statistics.mean(ops) * 1e6:7.1f}us  p99 {ops[int(len(ops) * 0.99)] * 1e6:7.1f}us  "
+        f"request mean {statistics.mean(requests) * 1e3:6.2f}ms  wall {elapsed:5.2f}s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000, help="lookups per worker")
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--upstream-ms", type=float, default=2.0)
+    parser.add_argument("--value-bytes", type=int, default=512)
+    args = parser.parse_args()
+
+    run_scenario("per-process", "", args)
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "bench_cache.sock")
+    daemon = multiprocessing.Process(target=run_daemon, args=(socket_path,), daemon=True)
+    daemon.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    try:
+        run_scenario("shared", socket_path, args)
+    finally:
+        daemon.terminate()
+        daemon.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+from app.llm.trip_schema import normalize_date, parse_trip_response, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Stray prose around the object, trailing comma
+    ('Sure! {"origin": "NYC",} Hope that helps', {"origin": "NYC"}),
+    # Python literals are fixed outside strings only
+    ('{"follow_up": "True story, None left", "is_complete": True}',
+     {"follow_up": "True story, None left", "is_complete": True}),
+    ('{"follow_up": "Any luggage, }?", }', {"follow_up": "Any luggage, }?"}),
+    # A brace inside a string neither ends the object nor unbalances it
+    ('{"origin": "NYC", "follow_up": "a}b"', {"origin": "NYC", "follow_up": "a}b"}),
+    ('{"follow_up": "a{b", "is_complete": false', {"follow_up": "a{b", "is_complete": False}),
+    # Truncated mid-value: the partial field is dropped, complete ones are kept
+    ('{"origin": "Chicago", "destination": "Bos', {"origin": "Chicago"}),
+    ('{"origin": "Chicago", "desti', {"origin": "Chicago"}),
+    ('{"a": {"b": 1}, "c": 2', {"a": {"b": 1}, "c": 2}),
+    # Quotes in prose after the object do not matter
+    ('{"origin": "NYC"} and then he said "hi', {"origin": "NYC"}),
+    ("{'origin': 'NYC', 'is_complete': False}", {"origin": "NYC", "is_complete": False}),
+    ("{“origin”: “NYC”}", {"origin": "NYC"}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["no json here", '{"origin": ', "[1, 2]"])
+def test_repair_json_gives_up(text):
+    assert repair_json(text) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-03-05", "2026-03-05"),
+    ("2026/03/05", "2026-03-05"),
+    ("03/05/2026", "2026-03-05"),
+    ("March 5th, 2026", "2026-03-05"),
+    ("5 Mar 2026", "2026-03-05"),
+    (date(2026, 3, 5), "2026-03-05"),
+    ("next week", ""),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_date(value, expected):
+    assert normalize_date(value) == expected
+
+
+def test_normalize_date_without_year_is_upcoming():
+    result = date.fromisoformat(normalize_date("March 5"))
+    assert (result.month, result.day) == (3, 5)
+    assert date.today() <= result
+
+
+def test_parse_trip_response():
+    trip, repaired = parse_trip_response(
+        '```json\n{"origin": "Chicago", "destination": "Boston", "start_date": "May 1, 2027",'
+        ' "end_date": null, "follow_up": "When do you return?", "is_complete": "no"}\n```'
+    )
+    assert not repaired
+    assert trip.origin == "Chicago"
+    assert trip.start_date == "2027-05-01"
+    assert trip.end_date == ""
+    assert trip.is_complete is False
+
+
+def test_parse_trip_response_repairs():
+    trip, repaired = parse_trip_response('Here you go: {"origin": "NYC", "follow_up": "a}b"')
+    assert repaired
+    assert (trip.origin, trip.follow_up) == ("NYC", "a}b")
+
+    with pytest.raises(ValueError):
+        parse_trip_response("I could not understand that")
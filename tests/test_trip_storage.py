@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.core.shared_cache import LocalCache
+from app.core.trip_storage import ChangesExpired, TripStorage
+
+
+class SlowDiskStorage(TripStorage):
+    """Makes every file write take 50ms and records how many ran at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.active_writes = 0
+        self.max_active_writes = 0
+
+    def _write_file(self, payload: str) -> None:
+        self.active_writes += 1
+        self.max_active_writes = max(self.max_active_writes, self.active_writes)
+        try:
+            time.sleep(0.05)
+            super()._write_file(payload)
+        finally:
+            self.active_writes -= 1
+
+
+def test_overlapping_flushes_are_serialized(tmp_path):
+    storage = SlowDiskStorage(
+        str(tmp_path / "trips.json"),
+        flush_delay=0.005,
+        changes_file=str(tmp_path / "changes.jsonl"),
+    )
+
+    async def main():
+        first = asyncio.create_task(storage.acreate_trip({"origin": "Chicago"}))
+        # Lands while the first flush is still writing
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(storage.acreate_trip({"origin": "Boston"}))
+        return await asyncio.gather(first, second)
+
+    trip_ids = asyncio.run(main())
+
+    assert storage.max_active_writes == 1
+    with open(tmp_path / "trips.json") as f:
+        on_disk = json.load(f)
+    assert set(on_disk) == set(trip_ids)
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_concurrent_writes_share_one_flush(tmp_path):
+    storage = SlowDiskStorage(
+        str(tmp_path / "trips.json"),
+        flush_delay=0.005,
+        changes_file=str(tmp_path / "changes.jsonl"),
+    )
+    flushes = []
+
+    async def publish():
+        flushes.append(len(storage.trip_data))
+
+    storage._publish = publish
+
+    async def main():
+        return await asyncio.gather(*(storage.acreate_trip({"n": i}) for i in range(20)))
+
+    trip_ids = asyncio.run(main())
+
+    assert len(set(trip_ids)) == 20
+    assert flushes == [20]
+
+
+class FlakyDiskStorage(TripStorage):
+    """Fails the first `failures` persists"""
+
+    def __init__(self, *args, failures: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def _persist(self, payload, events):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        return super()._persist(payload, events)
+
+
+def test_failed_flush_is_retried_not_dropped(tmp_path):
+    storage = FlakyDiskStorage(
+        str(tmp_path / "trips.json"),
+        flush_delay=0.005,
+        changes_file=str(tmp_path / "changes.jsonl"),
+        failures=2,
+    )
+
+    async def main():
+        first = asyncio.create_task(storage.acreate_trip({"origin": "Chicago"}))
+        await asyncio.sleep(0.01)
+        second = await storage.acreate_trip({"origin": "Boston"})
+        return await first, second, await storage.changes_since(0)
+
+    trip_a, trip_b, feed = asyncio.run(main())
+
+    with open(tmp_path / "trips.json") as f:
+        on_disk = json.load(f)
+    with open(tmp_path / "changes.jsonl") as f:
+        logged = [json.loads(line) for line in f]
+    assert set(on_disk) == {trip_a, trip_b}
+    # The write that failed first keeps its place in the log and the feed
+    assert [(event["seq"], event["trip_id"]) for event in logged] == [(1, trip_a), (2, trip_b)]
+    assert feed == logged
+
+
+def test_change_feed_is_ordered_across_workers(tmp_path):
+    cache = LocalCache()
+    paths = dict(changes_file=str(tmp_path / "changes.jsonl"), changes_retain=4)
+    worker_a = TripStorage(str(tmp_path / "trips.json"), cache=cache, **paths)
+    worker_b = TripStorage(str(tmp_path / "trips.json"), cache=cache, **paths)
+
+    async def main():
+        trip_a = await worker_a.acreate_trip({"origin": "Chicago"})
+        trip_b = await worker_b.acreate_trip({"origin": "Boston"})
+        # Enough writes from both sides to force several compactions of the shared log
+        for i in range(6):
+            # Both workers stage before either flushes
+            await asyncio.gather(worker_a.aupdate_trip(trip_a, {"n": i}), worker_b.aupdate_trip(trip_b, {"n": i}))
+        return trip_a, trip_b, await worker_a.changes_since(12), await worker_b.changes_since(12)
+
+    trip_a, trip_b, seen_by_a, seen_by_b = asyncio.run(main())
+
+    # Numbers follow commit order, so no consumer can skip an event that becomes durable later
+    assert [event["seq"] for event in seen_by_a] == [13, 14]
+    assert seen_by_a == seen_by_b
+    assert worker_a.trip_data == worker_b.trip_data
+    assert worker_a.trip_data[trip_b]["data"]["n"] == 5
+
+    with open(tmp_path / "changes.jsonl") as f:
+        on_disk = [json.loads(line)["seq"] for line in f]
+    assert on_disk == list(range(on_disk[0], 15))
+
+
+def test_expired_cursor(tmp_path):
+    storage = TripStorage(str(tmp_path / "trips.json"), changes_file=str(tmp_path / "changes.jsonl"),
+                          changes_retain=3)
+
+    async def main():
+        for i in range(5):
+            await storage.acreate_trip({"n": i})
+        with pytest.raises(ChangesExpired):
+            await storage.changes_since(0)
+        return await storage.changes_since(2)
+
+    assert [event["seq"] for event in asyncio.run(main())] == [3, 4, 5]